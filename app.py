@@ -1,24 +1,33 @@
 # --- IMPORTS ---
+import startup
+if startup.STARTUP_PROFILE: startup.start_import_profile()
+
 from flask import (
     Flask, request, render_template, redirect, url_for,
-    jsonify, send_from_directory, flash, session, abort
+    jsonify, send_from_directory, flash, session, abort,
+    Response, stream_with_context
 )
 from flask_login import (
-    LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+    LoginManager, login_user, logout_user, login_required, current_user
 )
 from functools import wraps
+from contextlib import closing
 import os
 import time
-import requests
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import datetime
 import random
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
 import logging
 import sys
 import re
+import threading
+import gzip
+import csv
+import io
+import json
+from enum import Enum
+from collections import namedtuple
 
 # Import from db_util
 from db_util import (
@@ -29,9 +38,21 @@ from db_util import (
     clear_all_system_logs,
     add_api_usage_log, get_all_api_usage_logs,
     get_user_stats_summary,
-    add_bulk_proxies, get_random_proxies_from_pool, get_pool_stats, clear_proxy_pool,
-    get_daily_api_usage_for_user, update_api_credits, get_pool_preview
+    add_bulk_proxies, get_random_proxies_from_pool, clear_proxy_pool,
+    get_daily_api_usage_for_user, update_api_credits,
+    add_log_entry_async, iter_export_rows, EXPORT_TABLES
 )
+from user_store import UserStore
+from startup import LazyModule, load_warm_snapshot, save_warm_snapshot
+
+# requests is only needed once a check or fetch runs; keep it off the cold-start path
+requests = LazyModule("requests")
+from ip_rules import IPRuleIndex, parse_rules
+from proxy_health import prioritize_proxies, record_results
+from ip_echo import detect_exit_ip, get_endpoint_stats, proxies_for
+from geo_inventory import add_verified, take_proxies, state_counts, state_key, known_state_key
+from pool_recycler import ensure_recycler, run_pass, get_recycler_status, RECYCLER_CONCURRENCY, PROBE_TIMEOUT
+from pool_cache import get_cached_pool_stats, get_cached_pool_preview, note_proxies_added, note_pool_cleared
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', stream=sys.stdout)
 logger = logging.getLogger(__name__)
@@ -46,32 +67,11 @@ login_manager.login_message_category = "warning"
 
 BLOCKED_IPS = {"192.168.1.50", "10.0.0.5"}
 
-class User(UserMixin):
-    def __init__(self, id, username, password, role="user", can_fetch=False):
-        self.id = id
-        self.username = username
-        self.password = password
-        self.role = role
-        self.can_fetch = can_fetch
-    
-    @property
-    def is_admin(self):
-        return self.role == "admin"
-    
-    @property 
-    def is_guest(self):
-        return self.role == "guest"
-
-# Initialize users dictionary - NO GLOBAL DECLARATION NEEDED AT MODULE LEVEL
-users = {
-    1: User(id=1, username="EL", password="ADMIN123", role="admin", can_fetch=True),
-    2: User(id=2, username="Work2", password="password", role="user", can_fetch=True),
-}
+user_store = UserStore()
 
 @login_manager.user_loader
 def load_user(user_id):
-    # No need for global declaration here as we're only reading, not modifying
-    return users.get(int(user_id))
+    return user_store.get(user_id)
 
 def admin_required(f):
     @wraps(f)
@@ -81,6 +81,15 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def api_login_required(f):
+    """login_required for JSON endpoints: a 401 body instead of a redirect to the HTML login page."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return json_response({"status": "error", "message": "Authentication required."}, 401)
+        return f(*args, **kwargs)
+    return decorated_function
+
 def get_user_ip():
     ip = request.headers.get('X-Forwarded-For')
     if ip:
@@ -91,6 +100,7 @@ DEFAULT_SETTINGS = {
     "MAX_PASTE": 30,
     "FRAUD_SCORE_LEVEL": 0,
     "MAX_WORKERS": 5,
+    "CHECK_TIME_BUDGET": 60,
     "SCAMALYTICS_API_KEY": "",
     "SCAMALYTICS_API_URL": "https://api11.scamalytics.com/v3/",
     "SCAMALYTICS_USERNAME": "",
@@ -104,7 +114,8 @@ DEFAULT_SETTINGS = {
     "PYPROXY_RESET_URL": "",
     "PIAPROXY_RESET_URL": "",
     "PASTE_INPUT_DISABLED": "FALSE",
-    "FORCE_FETCH_FOR_USERS": "FALSE"
+    "FORCE_FETCH_FOR_USERS": "FALSE",
+    "BLOCKED_CIDRS": ""
 }
 
 _SETTINGS_CACHE = None
@@ -116,35 +127,104 @@ def get_app_settings(force_refresh=False):
     if not force_refresh and _SETTINGS_CACHE and (time.time() - _SETTINGS_CACHE_TIME < CACHE_DURATION):
         return _SETTINGS_CACHE
     
-    try:
-        db_settings = get_settings()
-    except:
-        db_settings = {}
+    db_settings, loaded_at = load_warm_snapshot("settings") if _SETTINGS_CACHE is None and not force_refresh else (None, None)
+    if db_settings is None:
+        loaded_at = time.time()
+        try:
+            db_settings = get_settings()
+            if db_settings: save_warm_snapshot("settings", db_settings)
+        except:
+            db_settings = {}
     
     final_settings = DEFAULT_SETTINGS.copy()
     final_settings.update(db_settings)
     
-    try:
-        final_settings["MAX_PASTE"] = int(final_settings["MAX_PASTE"])
-        final_settings["FRAUD_SCORE_LEVEL"] = int(final_settings["FRAUD_SCORE_LEVEL"])
-        final_settings["MAX_WORKERS"] = int(final_settings["MAX_WORKERS"])
-        final_settings["CONSECUTIVE_FAILS"] = int(final_settings.get("CONSECUTIVE_FAILS", 0))
-    except:
-        pass
+    # Each numeric setting falls back to its default on its own, so one bad value can't leave the others as strings
+    for key in ("MAX_PASTE", "FRAUD_SCORE_LEVEL", "MAX_WORKERS", "CHECK_TIME_BUDGET", "CONSECUTIVE_FAILS"):
+        try:
+            final_settings[key] = int(final_settings.get(key))
+        except (TypeError, ValueError):
+            final_settings[key] = int(DEFAULT_SETTINGS[key])
     
     _SETTINGS_CACHE = final_settings
-    _SETTINGS_CACHE_TIME = time.time()
+    _SETTINGS_CACHE_TIME = loaded_at   # snapshot data is only as fresh as when it was saved
     return final_settings
 
+_BAD_IP_INDEX = None
+_BAD_IP_INDEX_KEY = None
+_BAD_IP_INDEX_TIME = 0
+
+def get_bad_ip_index(settings, force_refresh=False):
+    """
+    Compiled IPRuleIndex of logged bad IPs plus the admin's BLOCKED_CIDRS, rebuilt
+    every CACHE_DURATION or when the CIDR setting changes. IPs logged as bad in
+    between are added to it directly.
+    """
+    global _BAD_IP_INDEX, _BAD_IP_INDEX_KEY, _BAD_IP_INDEX_TIME
+    key = settings.get("BLOCKED_CIDRS", "")
+    if not force_refresh and _BAD_IP_INDEX is not None and key == _BAD_IP_INDEX_KEY and (time.time() - _BAD_IP_INDEX_TIME < CACHE_DURATION):
+        return _BAD_IP_INDEX
+    
+    bad_ips, loaded_at = load_warm_snapshot("bad_ips") if _BAD_IP_INDEX is None and not force_refresh else (None, None)
+    if bad_ips is None:
+        loaded_at = time.time()
+        bad_ips = []
+        for r in get_bad_proxies_list():
+            if r.get('ip'): bad_ips.append(str(r['ip']).strip())
+            elif r.get('proxy'):
+                local_ip = extract_ip_local(r['proxy'])
+                if local_ip: bad_ips.append(local_ip)
+        if bad_ips: save_warm_snapshot("bad_ips", bad_ips)
+    rules = parse_rules(key) + bad_ips
+    
+    _BAD_IP_INDEX = IPRuleIndex(rules)
+    _BAD_IP_INDEX_KEY = key
+    _BAD_IP_INDEX_TIME = loaded_at
+    return _BAD_IP_INDEX
+
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36",
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Safari/605.1.15"
 ]
 
 REQUEST_TIMEOUT = 5
+GZIP_MIN_BYTES = 1024
 MIN_DELAY = 0.5
 MAX_DELAY = 1.5
 
+class CheckDeadline:
+    """
+    Per-request time budget and cancellation flag shared by every check of a request.
+    Checks poll it between network calls and clamp their timeouts to what is left,
+    so leftover work stops as soon as the goal is reached or the budget runs out.
+    """
+    def __init__(self, budget=None):
+        budget = float(budget or 0)
+        self.expires_at = time.time() + budget if budget > 0 else None
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def expired(self):
+        if self._cancelled.is_set(): return True
+        return self.expires_at is not None and time.time() >= self.expires_at
+
+    def remaining(self):
+        if self._cancelled.is_set(): return 0
+        if self.expires_at is None: return None
+        return max(0, self.expires_at - time.time())
+
+    def timeout(self, default):
+        remaining = self.remaining()
+        return default if remaining is None else min(default, remaining)
+
+    def sleep(self, seconds):
+        """Sleeps up to seconds, waking early on cancel. Returns False if expired."""
+        self._cancelled.wait(self.timeout(seconds))
+        return not self.expired
+
 def parse_api_credentials(settings):
     raw_keys = settings.get("SCAMALYTICS_API_KEY", "")
     raw_users = settings.get("SCAMALYTICS_USERNAME", "")
@@ -182,38 +262,24 @@ def extract_ip_local(proxy_line):
     except:
         return None
 
-def get_ip_from_proxy(proxy_line):
+def get_ip_from_proxy(proxy_line, deadline=None):
     if not validate_proxy_format(proxy_line):
         return None
+    if deadline and deadline.expired:
+        return None
+    timeout = REQUEST_TIMEOUT-1 if not deadline else deadline.timeout(REQUEST_TIMEOUT-1)
     
     try:
-        host, port, user, pw = proxy_line.strip().split(":")
-        proxy_dict = {
-            "http": f"http://{user}:{pw}@{host}:{port}",
-            "https": f"http://{user}:{pw}@{host}:{port}"
-        }
-        
-        session = requests.Session()
-        retries = Retry(total=1, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504])
-        session.mount('http://', HTTPAdapter(max_retries=retries))
-        session.mount('https://', HTTPAdapter(max_retries=retries))
-        
-        response = session.get("https://ipv4.icanhazip.com", proxies=proxy_dict, 
-                             timeout=REQUEST_TIMEOUT-1, headers={"User-Agent": random.choice(USER_AGENTS)})
-        response.raise_for_status()
-        ip = response.text.strip()
-        
-        if ip and '.' in ip:
-            return ip
-        return None
+        return detect_exit_ip(proxies_for(proxy_line), timeout=timeout, headers={"User-Agent": random.choice(USER_AGENTS)})
     except:
         return None
 
-def verify_ip_stability(proxy_line, required_stable_checks=3, max_attempts=5):
+def verify_ip_stability(proxy_line, required_stable_checks=3, max_attempts=5, deadline=None):
     """
     Verify that a proxy returns the same IP address multiple times.
-    Returns the stable IP if consistent, None if unstable.
+    Returns the stable IP if consistent, None if unstable (or the deadline passed).
     """
+    pause = deadline.sleep if deadline else time.sleep
     if not validate_proxy_format(proxy_line):
         return None
     
@@ -221,11 +287,13 @@ def verify_ip_stability(proxy_line, required_stable_checks=3, max_attempts=5):
     stable_ip = None
     
     for attempt in range(max_attempts):
-        ip = get_ip_from_proxy(proxy_line)
+        if deadline and deadline.expired:
+            return None
+        ip = get_ip_from_proxy(proxy_line, deadline=deadline)
         
         if not ip:
             # If we can't get an IP at all, wait and retry
-            time.sleep(random.uniform(0.1, 0.3))
+            pause(random.uniform(0.1, 0.3))
             continue
         
         seen_ips.add(ip)
@@ -242,23 +310,27 @@ def verify_ip_stability(proxy_line, required_stable_checks=3, max_attempts=5):
         
         # Small delay between checks
         if attempt < max_attempts - 1:
-            time.sleep(random.uniform(0.1, 0.3))
+            pause(random.uniform(0.1, 0.3))
     
     return stable_ip
 
-def get_fraud_score_detailed(ip, proxy_line, credentials_list):
+def get_fraud_score_detailed(ip, proxy_line, credentials_list, deadline=None):
     if not validate_proxy_format(proxy_line) or not ip or not credentials_list:
         return None
     
     for cred in credentials_list:
+        # Never spend a credit on a check whose request has already finished or timed out
+        if deadline and deadline.expired:
+            return None
         try:
             host, port, user, pw = proxy_line.strip().split(":")
             proxy_url = f"http://{user}:{pw}@{host}:{port}"
             proxies = {"http": proxy_url, "https": proxy_url}
             url = f"{cred['url'].rstrip('/')}/{cred['user']}/?key={cred['key']}&ip={ip}"
             
+            timeout = REQUEST_TIMEOUT if not deadline else deadline.timeout(REQUEST_TIMEOUT)
             resp = requests.get(url, headers={"User-Agent": random.choice(USER_AGENTS)}, 
-                              proxies=proxies, timeout=REQUEST_TIMEOUT)
+                              proxies=proxies, timeout=timeout)
             
             if resp.status_code == 200:
                 data = resp.json()
@@ -282,68 +354,111 @@ def get_fraud_score_detailed(ip, proxy_line, credentials_list):
     
     return None
 
-def single_check_proxy_detailed(proxy_line, fraud_score_level, credentials_list, used_ip_set, bad_ip_set, is_strict_mode=False):
-    res = {"proxy": None, "ip": None, "credits": {}, "geo": {}, "score": None, 
-           "status": "error", "used": False, "cached_bad": False, "unstable": False}
+class CheckStatus(str, Enum):
+    SUCCESS = "success"
+    BAD_SCORE = "bad_score"
+    USED_CACHE = "used_cache"
+    BAD_CACHE = "bad_cache"
+    UNSTABLE_IP = "unstable_ip"
+    CANCELLED = "cancelled"
+    ERROR = "error"
+
+GeoInfo = namedtuple("GeoInfo", ["country_code", "state", "city", "postcode"])
+GEO_NA = GeoInfo("N/A", "N/A", "N/A", "N/A")
+GEO_ERR = GeoInfo("ERR", "ERR", "ERR", "ERR")
+
+def _geo_from_source(src):
+    if not src or "PREMIUM" in src.get("ip_country_code", ""): return None
+    # Country/state names repeat across thousands of results, so share one copy
+    intern_ = lambda v: sys.intern(v) if isinstance(v, str) else v
+    return GeoInfo(intern_(src.get("ip_country_code")), intern_(src.get("ip_state_name")), src.get("ip_city"), src.get("ip_postcode"))
+
+class CheckResult:
+    """Outcome of a single proxy check; only the fields the UI/API render are kept."""
+    __slots__ = ("proxy", "ip", "geo", "score", "status", "latency")
+
+    def __init__(self, status=CheckStatus.ERROR):
+        self.proxy = None
+        self.ip = None
+        self.geo = None
+        self.score = None
+        self.status = status
+        self.latency = None
+
+    @property
+    def used(self):
+        return self.status is CheckStatus.USED_CACHE
+
+    @property
+    def cached_bad(self):
+        return self.status is CheckStatus.BAD_CACHE
+
+    @property
+    def unstable(self):
+        return self.status is CheckStatus.UNSTABLE_IP
+
+    def to_dict(self):
+        return {
+            "proxy": self.proxy, "ip": self.ip, "geo": (self.geo or GEO_NA)._asdict(),
+            "score": self.score, "status": self.status.value, "used": self.used,
+            "cached_bad": self.cached_bad, "unstable": self.unstable, "latency": self.latency
+        }
+
+def single_check_proxy_detailed(proxy_line, fraud_score_level, credentials_list, used_ip_set, bad_ip_set, is_strict_mode=False, deadline=None):
+    res = CheckResult()
     
     if not validate_proxy_format(proxy_line):
         return res
     
     # First verify IP stability
-    ip = verify_ip_stability(proxy_line, required_stable_checks=3, max_attempts=5)
+    started = time.time()
+    ip = verify_ip_stability(proxy_line, required_stable_checks=3, max_attempts=5, deadline=deadline)
+    res.latency = round(time.time() - started, 3)
     
-    if not ip:
-        # If we get None from verify_ip_stability, it means the IP was unstable
-        res["status"] = "unstable_ip"
-        res["unstable"] = True
+    if deadline and deadline.expired:
+        res.status = CheckStatus.CANCELLED
         return res
     
-    res["ip"] = ip
-    
     if not ip:
+        # If we get None from verify_ip_stability, it means the IP was unstable
+        res.status = CheckStatus.UNSTABLE_IP
         return res
+    
+    res.ip = ip
 
     if str(ip).strip() in used_ip_set:
-        res["used"] = True
-        res["status"] = "used_cache"
+        res.status = CheckStatus.USED_CACHE
         return res
     
     if str(ip).strip() in bad_ip_set:
-        res["cached_bad"] = True
-        res["status"] = "bad_cache"
+        res.status = CheckStatus.BAD_CACHE
         return res
 
-    time.sleep(random.uniform(MIN_DELAY, MAX_DELAY))
-    data = get_fraud_score_detailed(ip, proxy_line, credentials_list)
-    
-    if data and data.get("scamalytics", {}).get("credits"):
-        res["credits"] = data.get("scamalytics", {}).get("credits", {})
+    if deadline:
+        if not deadline.sleep(random.uniform(MIN_DELAY, MAX_DELAY)):
+            res.status = CheckStatus.CANCELLED
+            return res
+    else:
+        time.sleep(random.uniform(MIN_DELAY, MAX_DELAY))
+    data = get_fraud_score_detailed(ip, proxy_line, credentials_list, deadline=deadline)
     
     try:
         ext_src = data.get("external_datasources", {}) if data else {}
-        geo = {}
-        mm = ext_src.get("maxmind_geolite2", {})
-        if mm and "PREMIUM" not in mm.get("ip_country_code", ""):
-            geo = {"country_code": mm.get("ip_country_code"), "state": mm.get("ip_state_name"), "city": mm.get("ip_city"), "postcode": mm.get("ip_postcode")}
-        if not geo:
-            db = ext_src.get("dbip", {})
-            if db and "PREMIUM" not in db.get("ip_country_code", ""):
-                geo = {"country_code": db.get("ip_country_code"), "state": db.get("ip_state_name"), "city": db.get("ip_city"), "postcode": db.get("ip_postcode")}
-        res["geo"] = geo if geo else {"country_code": "N/A", "state": "N/A", "city": "N/A", "postcode": "N/A"}
+        res.geo = _geo_from_source(ext_src.get("maxmind_geolite2", {})) or _geo_from_source(ext_src.get("dbip", {})) or GEO_NA
     except:
-        res["geo"] = {"country_code": "ERR", "state": "ERR", "city": "ERR", "postcode": "ERR"}
+        res.geo = GEO_ERR
     
     if data and data.get("scamalytics"):
         scam = data.get("scamalytics", {})
         score = scam.get("scamalytics_score")
-        res["score"] = score
+        res.score = score
         
         if scam.get("status") != "ok":
             return res
         
         try:
             score_int = int(score)
-            res["score"] = score_int
+            res.score = score_int
             passed = True
             
             if score_int > fraud_score_level:
@@ -357,19 +472,162 @@ def single_check_proxy_detailed(proxy_line, fraud_score_level, credentials_list,
                     if pf.get(f) is True: passed = False
                 
             if passed:
-                res["proxy"] = proxy_line
-                res["status"] = "success"
+                res.proxy = proxy_line
+                res.status = CheckStatus.SUCCESS
             elif score_int > fraud_score_level:
                 try:
                     log_bad_proxy(proxy_line, ip, score_int)
+                    bad_ip_set.add(ip)
                 except:
                     pass
-                res["status"] = "bad_score"
+                res.status = CheckStatus.BAD_SCORE
         except:
             pass
     
     return res
 
+def check_proxies_sliding(proxies, check_fn, max_workers, metrics=None, deadline=None):
+    """
+    Runs check_fn over proxies keeping exactly max_workers checks in flight.
+    A slot is refilled the moment any check finishes (no lock-step batches), and
+    results are yielded in completion order. Closing the generator (e.g. breaking
+    out of the loop once enough good proxies are in) cancels outstanding work.
+    With a deadline, no new work is started once it expires and closing the
+    generator cancels it and returns without waiting for in-flight checks.
+    If a metrics dict is passed it is filled with scheduler/utilization stats.
+    """
+    metrics = metrics if metrics is not None else {}
+    max_workers = max(1, int(max_workers or 1))
+    pending_iter = iter(proxies)
+    in_flight = {}
+    durations = []
+    started = time.time()
+    submitted = completed = peak = 0
+
+    def timed(p):
+        t0 = time.time()
+        try:
+            return check_fn(p)
+        finally:
+            durations.append(time.time() - t0)
+
+    def refill():
+        nonlocal submitted, peak
+        while len(in_flight) < max_workers:
+            if deadline and deadline.expired: return
+            p = next(pending_iter, None)
+            if p is None: return
+            in_flight[executor.submit(timed, p)] = p
+            submitted += 1
+        peak = max(peak, len(in_flight))
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        refill()
+        while in_flight:
+            done, _ = wait(in_flight, timeout=deadline.remaining() if deadline else None, return_when=FIRST_COMPLETED)
+            if not done:
+                logger.warning(f"Check deadline reached with {len(in_flight)} checks in flight.")
+                break
+            for f in done:
+                in_flight.pop(f, None)
+            # Hand results over before refilling, so a caller that stops here leaves no fresh checks running
+            for f in done:
+                completed += 1
+                yield f.result()
+            refill()
+    finally:
+        if deadline: deadline.cancel()
+        cancelled = sum(1 for f in in_flight if f.cancel())
+        executor.shutdown(wait=deadline is None)
+        abandoned = len(in_flight) - cancelled if deadline else 0   # without a deadline shutdown waited for them
+        wall = max(time.time() - started, 1e-6)
+        busy = sum(durations)
+        metrics.update({
+            "workers": max_workers, "submitted": submitted, "completed": completed,
+            "cancelled": cancelled, "abandoned": abandoned, "peak_in_flight": peak,
+            "wall_time": round(wall, 3), "busy_time": round(busy, 3),
+            "utilization": round(min(1.0, busy / (wall * max_workers)), 3)
+        })
+        logger.info(f"Check scheduler: {metrics}")
+
+def run_check_pipeline(proxies_input, settings, fraud_score_level, api_credentials, is_strict_mode=True, target_good=2, state=None):
+    """
+    Checks submitted proxy lines until target_good good ones are found (shared by the
+    HTML form and the JSON API). Applies the guest quota, records proxy health,
+    updates the consecutive-fail counter and logs API usage for the current user.
+    With a target state, fresh verified proxies for that state are served from the
+    geo inventory first and only the shortfall is checked live; live results in a
+    known other state are stored in the inventory instead of returned.
+    Returns (good result dicts, stats dict).
+    """
+    used_rows = get_all_used_ips()
+    used_ip_set = {str(r['IP']).strip() for r in used_rows if r.get('IP')}
+    bad_ip_index = get_bad_ip_index(settings)
+
+    from_inventory = []
+    if state:
+        from_inventory = take_proxies(state, target_good, exclude=lambda ip: ip in used_ip_set or ip in bad_ip_index,
+                                      fraud_score_level=fraud_score_level, is_strict_mode=is_strict_mode)
+    needed = target_good - len(from_inventory)
+
+    proxies_raw = [p.strip() for p in proxies_input if validate_proxy_format(p.strip())] if needed > 0 else []
+    # Drop proxies whose host is already in a blocked range before spending a stability check on them
+    host_blocked = bad_ip_index.contains_many([extract_ip_local(p) for p in proxies_raw])
+    blocked_count = sum(host_blocked)
+    proxies_raw = [p for p, blocked in zip(proxies_raw, host_blocked) if not blocked]
+    # Historically fast, stable, clean proxies first; known-dead ones last
+    proxies_raw, dead_count = prioritize_proxies(proxies_raw)
+    
+    good_proxy_results = []
+    other_state_results = []
+    health_updates = []
+    stats = {"used": 0, "bad": blocked_count, "api": 0, "unstable": 0, "dead": dead_count, "inventory": len(from_inventory)}
+    wanted_state = state_key(state) if state else None
+    
+    if current_user.is_guest:
+        daily_usage = get_daily_api_usage_for_user(current_user.username)
+        remaining_calls = max(0, 150 - daily_usage)
+        if remaining_calls < len(proxies_raw): proxies_raw = proxies_raw[:remaining_calls]
+    
+    seen_ips = set()
+    deadline = CheckDeadline(settings["CHECK_TIME_BUDGET"])
+    check_fn = lambda p: (p, single_check_proxy_detailed(p, fraud_score_level, api_credentials, used_ip_set, bad_ip_index, is_strict_mode=is_strict_mode, deadline=deadline))
+    with closing(check_proxies_sliding(proxies_raw, check_fn, settings["MAX_WORKERS"], deadline=deadline)) as checks:
+        for proxy_line, res in checks:
+            health_updates.append((proxy_line, res.status.value, res.latency))
+            if res.status is CheckStatus.USED_CACHE: stats["used"] += 1
+            elif res.status is CheckStatus.BAD_CACHE: stats["bad"] += 1
+            elif res.status is CheckStatus.UNSTABLE_IP: stats["unstable"] += 1
+            elif res.status in (CheckStatus.SUCCESS, CheckStatus.BAD_SCORE): stats["api"] += 1
+            if res.proxy and res.ip not in seen_ips:
+                seen_ips.add(res.ip)
+                # Only a known, different state is withheld; unknown geo goes back to the caller
+                found_state = known_state_key(res.geo.state) if wanted_state and res.geo else None
+                if found_state and found_state != wanted_state: other_state_results.append(res)
+                else: good_proxy_results.append(res)
+            if len(good_proxy_results) >= needed: break
+    record_results(health_updates)
+    if other_state_results: add_verified(other_state_results, is_strict_mode=is_strict_mode)
+
+    results = from_inventory + [r.to_dict() for r in good_proxy_results]
+    good_final = len(results)
+    fails = settings.get("CONSECUTIVE_FAILS", 0)
+    # Proxies stored for other states were good too, so they reset the fail streak as well
+    if (good_final or other_state_results) and fails > 0:
+        update_setting("CONSECUTIVE_FAILS", "0")
+        _SETTINGS_CACHE["CONSECUTIVE_FAILS"] = 0
+    elif not good_final and not other_state_results and proxies_raw:
+        new_fails = fails + len(proxies_raw)
+        update_setting("CONSECUTIVE_FAILS", str(new_fails))
+        if new_fails > 1000:
+            update_setting("SYSTEM_PAUSED", "TRUE")
+            add_log_entry("CRITICAL", "Auto-paused.", ip="System")
+    
+    try: add_api_usage_log(current_user.username, get_user_ip(), len(proxies_input), stats["api"], good_final)
+    except: pass
+    return results, stats
+
 @app.before_request
 def before_request_func():
     if get_user_ip() in BLOCKED_IPS: abort(404)
@@ -381,23 +639,22 @@ def login():
         return redirect(url_for('admin') if current_user.is_admin else url_for('index'))
     error = None
     if request.method == 'POST':
-        # No global users needed here - just reading from module-level variable
-        user = next((u for u in users.values() if u.username == request.form.get('username')), None)
-        if user and user.password == request.form.get('password'):
+        user = user_store.authenticate(request.form.get('username'), request.form.get('password'))
+        if user:
             login_user(user, remember=(request.form.get('remember') == 'on'))
             next_p = request.args.get('next')
             if next_p and not current_user.is_admin and '/admin' in next_p: next_p = url_for('index')
             if current_user.is_admin and next_p == url_for('index'): next_p = url_for('admin')
-            add_log_entry("INFO", f"User {user.username} logged in.", ip=get_user_ip())
+            add_log_entry_async("INFO", f"User {user.username} logged in.", ip=get_user_ip())
             return redirect(next_p or (url_for('admin') if current_user.is_admin else url_for('index')))
         error = 'Invalid Credentials.'
-        add_log_entry("WARNING", f"Failed login: {request.form.get('username')}", ip=get_user_ip())
+        add_log_entry_async("WARNING", f"Failed login: {request.form.get('username')}", ip=get_user_ip())
     return render_template('login.html', error=error)
 
 @app.route('/logout')
 @login_required
 def logout():
-    add_log_entry("INFO", f"User {current_user.username} logged out.", ip=get_user_ip())
+    add_log_entry_async("INFO", f"User {current_user.username} logged out.", ip=get_user_ip())
     logout_user()
     return redirect(url_for('login'))
 
@@ -467,24 +724,43 @@ def admin_pool():
             provider = request.form.get('provider', 'manual')
             text = request.form.get('bulk_proxies', '')
             lines = [l.strip() for l in text.splitlines() if validate_proxy_format(l)]
+            blocked = get_bad_ip_index(settings).contains_many([extract_ip_local(l) for l in lines])
+            if any(blocked):
+                flash(f"Skipped {sum(blocked)} proxies in blocked IP ranges.", "warning")
+                lines = [l for l, b in zip(lines, blocked) if not b]
             if lines:
                 count = add_bulk_proxies(lines, provider)
+                note_proxies_added(provider, count)
                 flash(f"Added {count} proxies to {provider}.", "success")
             else:
                 flash("No valid proxies.", "warning")
         elif 'clear_pool' in request.form:
             target = request.form.get('clear_target', 'all')
             if clear_proxy_pool(target):
+                note_pool_cleared(target)
                 flash(f"Pool cleared ({target}).", "success")
             else:
                 flash("Error clearing pool.", "danger")
+        elif 'recycle_pool' in request.form:
+            # One probe wave keeps the request short (serverless); strikes persist between passes
+            summary = run_pass(batch_size=RECYCLER_CONCURRENCY, lease_ttl=2 * PROBE_TIMEOUT + 5)
+            if summary is None:
+                flash("A recycle pass is already running or ran moments ago on another worker.", "warning")
+            elif summary.get("outage"):
+                flash("Recycle pass skipped: echo endpoints are unreachable even without a proxy.", "warning")
+            else:
+                evicted = sum(summary["evicted"].values())
+                flash(f"Recycle pass: probed {summary['probed']}, {summary['alive']} alive, {summary['struck']} struck, evicted {evicted}.", "success")
+                if summary.get("endpoint_outage"):
+                    flash(f"{summary['skipped']} failed probes were not struck: most of the pass failed on {summary['endpoint_outage']}.", "warning")
         return redirect(url_for('admin_pool'))
     
-    counts = get_pool_stats()
-    preview_py = get_pool_preview('pyproxy')
-    preview_pia = get_pool_preview('piaproxy')
+    ensure_recycler()
+    counts = get_cached_pool_stats()
+    preview_py = get_cached_pool_preview('pyproxy')
+    preview_pia = get_cached_pool_preview('piaproxy')
     
-    return render_template('admin_pool.html', counts=counts, settings=settings, preview_py=preview_py, preview_pia=preview_pia)
+    return render_template('admin_pool.html', counts=counts, settings=settings, preview_py=preview_py, preview_pia=preview_pia, inventory=state_counts(), recycler=get_recycler_status())
 
 @app.route('/api/trigger-reset/<provider>')
 @admin_required
@@ -501,6 +777,7 @@ def trigger_reset(provider):
 @login_required
 def fetch_pool_proxies():
     if not current_user.can_fetch: return jsonify({"status": "error", "message": "Permission denied."}), 403
+    ensure_recycler()
     settings = get_app_settings()
     limit = int(settings.get("MAX_PASTE", 30))
     proxies = get_random_proxies_from_pool(limit)
@@ -546,79 +823,92 @@ def index():
         if not proxies_input:
             return render_template("index.html", results=[], message="No proxies submitted.", max_paste=MAX_PASTE, settings=settings, announcement=settings.get("ANNOUNCEMENT"), paste_disabled_for_user=paste_disabled_for_user)
         
-        used_rows = get_all_used_ips()
-        used_ip_set = {str(r['IP']).strip() for r in used_rows if r.get('IP')}
-        bad_rows = get_bad_proxies_list()
-        bad_ip_set = set()
-        for r in bad_rows:
-            if r.get('ip'): bad_ip_set.add(str(r['ip']).strip())
-            elif r.get('proxy'):
-                local_ip = extract_ip_local(r['proxy'])
-                if local_ip: bad_ip_set.add(local_ip)
-
-        proxies_raw = [p.strip() for p in proxies_input if validate_proxy_format(p.strip())]
-        
-        good_proxy_results = []
-        stats = {"used": 0, "bad": 0, "api": 0, "unstable": 0}
-        target_good = 2
-        
-        if current_user.is_guest:
-            daily_usage = get_daily_api_usage_for_user(current_user.username)
-            remaining_calls = max(0, 150 - daily_usage)
-            if remaining_calls < len(proxies_raw): proxies_raw = proxies_raw[:remaining_calls]
-        
-        batch_size = settings["MAX_WORKERS"]
-        with ThreadPoolExecutor(max_workers=batch_size) as executor:
-            for i in range(0, len(proxies_raw), batch_size):
-                good_count = len([r for r in good_proxy_results if not r['used'] and not r['cached_bad']])
-                if good_count >= target_good: break
-                batch = proxies_raw[i : i + batch_size]
-                futures = {executor.submit(single_check_proxy_detailed, p, FRAUD_SCORE_LEVEL, api_credentials, used_ip_set, bad_ip_set, is_strict_mode=True): p for p in batch}
-                for f in as_completed(futures):
-                    res = f.result()
-                    if res["status"] == "used_cache": stats["used"] += 1
-                    elif res["status"] == "bad_cache": stats["bad"] += 1
-                    elif res["status"] == "unstable_ip": stats["unstable"] += 1
-                    elif res["status"] in ["success", "bad_score"]: stats["api"] += 1
-                    if res.get("proxy"): good_proxy_results.append(res)
-                good_count = len([r for r in good_proxy_results if not r['used'] and not r['cached_bad']])
-                if good_count >= target_good: break
-
-        unique_results = []
-        seen = set()
-        for r in good_proxy_results:
-            if r['ip'] not in seen:
-                seen.add(r['ip'])
-                unique_results.append(r)
-        
-        results = sorted(unique_results, key=lambda x: x.get('used', False))
+        results, stats = run_check_pipeline(proxies_input, settings, FRAUD_SCORE_LEVEL, api_credentials,
+                                            state=request.form.get("target_state", "").strip() or None)
         good_final = len(results)
         
-        fails = settings.get("CONSECUTIVE_FAILS", 0)
-        if good_final > 0 and fails > 0:
-            update_setting("CONSECUTIVE_FAILS", "0")
-            _SETTINGS_CACHE["CONSECUTIVE_FAILS"] = 0
-        elif not good_final and proxies_raw:
-            new_fails = fails + len(proxies_raw)
-            update_setting("CONSECUTIVE_FAILS", str(new_fails))
-            if new_fails > 1000:
-                update_setting("SYSTEM_PAUSED", "TRUE")
-                add_log_entry("CRITICAL", "Auto-paused.", ip="System")
-        
-        try: add_api_usage_log(current_user.username, get_user_ip(), len(proxies_input), stats["api"], good_final)
-        except: pass
-        
         msg_prefix = "⚠️ MAINTENANCE (Admin) - " if admin_bypass else ""
         if current_user.is_guest and good_final == 0: 
             message = "No good proxies found in this batch."
         else: 
             message = f"{msg_prefix}Found {good_final} good proxies. ({stats['used']} from cache, {stats['bad']} skipped bad, {stats['unstable']} unstable, {stats['api']} live checked)"
+            if stats["inventory"]: message += f" {stats['inventory']} served from verified inventory."
+            if stats["dead"]: message += f" {stats['dead']} known-dead proxies were queued last."
         
         return render_template("index.html", results=results, message=message, max_paste=MAX_PASTE, settings=settings, announcement=settings.get("ANNOUNCEMENT"), system_paused=False, paste_disabled_for_user=paste_disabled_for_user)
 
     msg_prefix = "⚠️ MAINTENANCE (Admin)" if admin_bypass else ""
     return render_template("index.html", results=None, message=msg_prefix, max_paste=MAX_PASTE, settings=settings, announcement=settings.get("ANNOUNCEMENT"), system_paused=False, paste_disabled_for_user=paste_disabled_for_user)
 
+def json_response(payload, status=200):
+    """jsonify, gzip-compressed when the body is large and the client accepts it."""
+    resp = jsonify(payload)
+    resp.status_code = status
+    if len(resp.get_data()) >= GZIP_MIN_BYTES and 'gzip' in request.headers.get('Accept-Encoding', '').lower():
+        resp.set_data(gzip.compress(resp.get_data(), compresslevel=5))
+        resp.headers['Content-Encoding'] = 'gzip'
+        resp.headers['Vary'] = 'Accept-Encoding'
+    return resp
+
+def _as_bool(value, default):
+    if value is None: return default
+    if isinstance(value, bool): return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+@app.route("/api/v1/check", methods=["POST"])
+@api_login_required
+def api_check():
+    """
+    JSON check API. Body is either JSON {"proxies": [...] | "a\\nb", "strict": bool,
+    "fraud_score": int, "target": int, "state": str}, a bare JSON list of proxies, or
+    newline-separated text with the options as query parameters. Same pipeline,
+    limits and quotas as the form on /.
+    """
+    settings = get_app_settings()
+    MAX_PASTE = settings["MAX_PASTE"]
+    system_paused = str(settings.get("SYSTEM_PAUSED", "FALSE")).upper() == "TRUE"
+    if system_paused and not current_user.is_admin:
+        return json_response({"status": "error", "message": "System Under Maintenance."}, 503)
+    force_fetch_for_users = str(settings.get("FORCE_FETCH_FOR_USERS", "FALSE")).upper() == "TRUE"
+    if current_user.role == "user" and force_fetch_for_users:
+        return json_response({"status": "error", "message": "Manual submission is disabled."}, 403)
+    if current_user.is_guest and get_daily_api_usage_for_user(current_user.username) >= 150:
+        return json_response({"status": "error", "message": "Daily limit reached."}, 429)
+
+    if request.is_json:
+        options = request.get_json(silent=True) or {}
+        if isinstance(options, list): options = {"proxies": options}
+        if not isinstance(options, dict):
+            return json_response({"status": "error", "message": "JSON body must be an object or a list of proxies."}, 400)
+        raw = options.get("proxies", [])
+    else:
+        options = request.args
+        raw = request.get_data(as_text=True)
+    if isinstance(raw, str): raw = raw.strip().splitlines()
+    if not isinstance(raw, list):
+        return json_response({"status": "error", "message": "proxies must be a list or newline text."}, 400)
+    proxies_input = [str(p) for p in raw][:MAX_PASTE]
+    state = str(options.get("state") or "").strip() or None
+    if not proxies_input and not state:
+        return json_response({"status": "error", "message": "No proxies submitted."}, 400)
+
+    try:
+        fraud_score_level = int(options.get("fraud_score", settings["FRAUD_SCORE_LEVEL"]))
+        target_good = int(options.get("target", 2))
+    except (TypeError, ValueError):
+        return json_response({"status": "error", "message": "fraud_score and target must be integers."}, 400)
+    # Clients may tighten the admin threshold but never loosen it
+    if not current_user.is_admin: fraud_score_level = min(fraud_score_level, settings["FRAUD_SCORE_LEVEL"])
+    target_good = max(1, min(target_good, MAX_PASTE))
+    is_strict_mode = _as_bool(options.get("strict"), True)
+
+    good, stats = run_check_pipeline(proxies_input, settings, fraud_score_level, parse_api_credentials(settings),
+                                     is_strict_mode=is_strict_mode, target_good=target_good, state=state)
+    return json_response({
+        "status": "success", "version": 1, "submitted": len(proxies_input),
+        "stats": dict(stats, good=len(good)), "results": good
+    })
+
 @app.route("/track-used", methods=["POST"])
 @login_required
 def track_used():
@@ -654,7 +944,48 @@ def admin():
         "sx_generation_url": settings.get("SX_GENERATION_URL"),
         "force_fetch_for_users": settings.get("FORCE_FETCH_FOR_USERS", "FALSE")
     }
-    return render_template("admin.html", stats=stats, used_ips=get_all_used_ips(), announcement=settings.get("ANNOUNCEMENT"), settings=settings, stones_daily_usage=stones_daily_usage)
+    return render_template("admin.html", stats=stats, used_ips=get_all_used_ips(limit=1000), announcement=settings.get("ANNOUNCEMENT"), settings=settings, stones_daily_usage=stones_daily_usage)
+
+@app.route("/admin/export/<dataset>.<fmt>")
+@admin_required
+def admin_export(dataset, fmt):
+    """Streams a full table as CSV or NDJSON, page by page, without buffering it in memory."""
+    if dataset not in EXPORT_TABLES or fmt not in ("csv", "ndjson"): abort(404)
+    columns = EXPORT_TABLES[dataset][1]
+
+    # The 200 status is already sent when a page fails mid-stream, so a failure is
+    # reported in-band as a last line: "#EXPORT_INCOMPLETE,<error>" or {"_export_error": ...}
+    def export_failed(e):
+        logger.error(f"Export {dataset}.{fmt} incomplete: {e}")
+        add_log_entry_async("ERROR", f"Export {dataset}.{fmt} incomplete: {e}", ip=get_user_ip())
+        return f"{type(e).__name__}: {e}"
+
+    def generate_csv():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(columns)
+        try:
+            for row in iter_export_rows(dataset):
+                writer.writerow([row.get(c) for c in columns])
+                if buf.tell() > 64 * 1024:
+                    yield buf.getvalue()
+                    buf.seek(0); buf.truncate()
+        except Exception as e:
+            writer.writerow(["#EXPORT_INCOMPLETE", export_failed(e)])
+        yield buf.getvalue()
+
+    def generate_ndjson():
+        try:
+            for row in iter_export_rows(dataset):
+                yield json.dumps({c: row.get(c) for c in columns}, default=str) + "\n"
+        except Exception as e:
+            yield json.dumps({"_export_error": export_failed(e), "incomplete": True}) + "\n"
+
+    add_log_entry_async("INFO", f"Export {dataset}.{fmt} by {current_user.username}", ip=get_user_ip())
+    stamp = datetime.datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    body = generate_csv() if fmt == "csv" else generate_ndjson()
+    return Response(stream_with_context(body), mimetype="text/csv" if fmt == "csv" else "application/x-ndjson",
+                    headers={"Content-Disposition": f"attachment; filename={dataset}-{stamp}.{fmt}"})
 
 @app.route("/admin/reset-system", methods=["POST"])
 @admin_required
@@ -724,6 +1055,7 @@ def admin_settings():
             "MAX_PASTE": f.get("max_paste"),
             "FRAUD_SCORE_LEVEL": f.get("fraud_score_level"),
             "MAX_WORKERS": f.get("max_workers"),
+            "CHECK_TIME_BUDGET": f.get("check_time_budget", "").strip() or curr.get("CHECK_TIME_BUDGET"),
             "SCAMALYTICS_API_KEY": f.get("scamalytics_api_key", "").strip(),
             "SCAMALYTICS_API_URL": f.get("scamalytics_api_url", "").strip(),
             "SCAMALYTICS_USERNAME": f.get("scamalytics_username", "").strip(),
@@ -731,7 +1063,8 @@ def admin_settings():
             "SX_GENERATION_URL": f.get("sx_generation_url", "").strip(),
             "PYPROXY_RESET_URL": f.get("pyproxy_reset_url", "").strip(),
             "PIAPROXY_RESET_URL": f.get("piaproxy_reset_url", "").strip(),
-            "FORCE_FETCH_FOR_USERS": f.get("force_fetch_for_users", "FALSE")
+            "FORCE_FETCH_FOR_USERS": f.get("force_fetch_for_users", "FALSE"),
+            "BLOCKED_CIDRS": "\n".join(parse_rules(f.get("blocked_cidrs", "")))
         }
         for k, v in upd.items():
             update_setting(k, str(v))
@@ -754,11 +1087,23 @@ def delete_used_ip_route(ip):
     delete_used_ip(ip)
     return redirect(url_for("admin"))
 
+@app.route("/admin/startup-profile")
+@admin_required
+def admin_startup_profile():
+    return jsonify(startup.get_import_profile(top=int(request.args.get("top", 30))))
+
+@app.route("/admin/ip-echo-stats")
+@admin_required
+def admin_ip_echo_stats():
+    return jsonify(get_endpoint_stats())
+
 @app.errorhandler(404)
 def page_not_found(e): return render_template('error.html', error='Page not found.'), 404
 @app.errorhandler(500)
 def internal_server_error(e): return render_template('error.html', error='Server Error.'), 500
 
+if startup.STARTUP_PROFILE: startup.finish_import_profile()
+
 if __name__ == "__main__":
     add_log_entry("INFO", "Server starting up.")
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)), debug=False)
@@ -0,0 +1,360 @@
+"""
+Embedded SQLite storage backend. Same function names and return shapes as the
+Supabase functions in db_util; enabled there with DB_BACKEND=sqlite.
+"""
+import os
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "proxy_checker.db")
+
+__all__ = [
+    "get_settings", "update_setting",
+    "add_used_ip", "delete_used_ip", "get_all_used_ips",
+    "log_bad_proxy", "get_bad_proxies_list",
+    "add_log_entry", "get_all_system_logs", "clear_all_system_logs",
+    "get_app_users",
+    "add_api_usage_log", "get_all_api_usage_logs", "get_user_stats_summary",
+    "get_daily_api_usage_for_user", "update_api_credits",
+    "iter_export_rows",
+    "add_bulk_proxies", "get_random_proxies_from_pool", "get_pool_stats",
+    "get_pool_preview", "clear_proxy_pool", "get_pool_batch", "mark_pool_probed", "delete_pool_proxies",
+    "acquire_lease",
+]
+
+# Timestamps match Supabase's ISO format so callers can keep using startswith/fromisoformat
+_NOW = "(strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))"
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS used_proxies (
+    id INTEGER PRIMARY KEY,
+    ip TEXT NOT NULL UNIQUE,
+    proxy TEXT,
+    username TEXT,
+    created_at TEXT NOT NULL DEFAULT {_NOW}
+);
+CREATE INDEX IF NOT EXISTS idx_used_proxies_username ON used_proxies(username);
+CREATE INDEX IF NOT EXISTS idx_used_proxies_created_at ON used_proxies(created_at);
+CREATE TABLE IF NOT EXISTS bad_proxies (
+    id INTEGER PRIMARY KEY,
+    ip TEXT UNIQUE,
+    proxy TEXT,
+    score INTEGER,
+    created_at TEXT NOT NULL DEFAULT {_NOW}
+);
+CREATE INDEX IF NOT EXISTS idx_bad_proxies_created_at ON bad_proxies(created_at);
+CREATE TABLE IF NOT EXISTS system_logs (
+    id INTEGER PRIMARY KEY,
+    level TEXT,
+    message TEXT,
+    ip TEXT,
+    created_at TEXT NOT NULL DEFAULT {_NOW}
+);
+CREATE INDEX IF NOT EXISTS idx_system_logs_created_at ON system_logs(created_at);
+CREATE TABLE IF NOT EXISTS api_usage (
+    id INTEGER PRIMARY KEY,
+    username TEXT,
+    user_ip TEXT,
+    submitted_count INTEGER,
+    api_calls_count INTEGER,
+    good_proxies_count INTEGER,
+    created_at TEXT NOT NULL DEFAULT {_NOW}
+);
+CREATE INDEX IF NOT EXISTS idx_api_usage_username_created_at ON api_usage(username, created_at);
+CREATE INDEX IF NOT EXISTS idx_api_usage_created_at ON api_usage(created_at);
+CREATE TABLE IF NOT EXISTS proxy_pool (
+    id INTEGER PRIMARY KEY,
+    proxy TEXT NOT NULL UNIQUE,
+    provider TEXT,
+    created_at TEXT NOT NULL DEFAULT {_NOW},
+    fail_count INTEGER NOT NULL DEFAULT 0,
+    last_probe_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_proxy_pool_provider_created_at ON proxy_pool(provider, created_at);
+CREATE TABLE IF NOT EXISTS app_users (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    role TEXT NOT NULL DEFAULT 'user',
+    can_fetch INTEGER NOT NULL DEFAULT 0
+);
+CREATE VIEW IF NOT EXISTS user_stats_view AS
+    SELECT username,
+           MAX(created_at) AS last_active,
+           COUNT(*) AS total_sessions,
+           COALESCE(SUM(api_calls_count), 0) AS total_api_calls,
+           COALESCE(SUM(good_proxies_count), 0) AS total_good_proxies,
+           (SELECT a2.user_ip FROM api_usage a2 WHERE a2.username = a.username
+            ORDER BY a2.created_at DESC LIMIT 1) AS last_ip
+    FROM api_usage a GROUP BY username;
+"""
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+def _conn():
+    """One connection per thread; the schema is created on first use."""
+    global _schema_ready
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(SQLITE_PATH, timeout=10, isolation_level=None,
+                               uri=SQLITE_PATH.startswith("file:"))
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+    if not _schema_ready:
+        with _schema_lock:
+            if not _schema_ready:
+                conn.executescript(_SCHEMA)
+                for column in ("fail_count INTEGER NOT NULL DEFAULT 0", "last_probe_at TEXT"):
+                    try: conn.execute(f"ALTER TABLE proxy_pool ADD COLUMN {column}")  # pre-recycler databases
+                    except sqlite3.OperationalError: pass
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_proxy_pool_last_probe_at ON proxy_pool(last_probe_at, id)")
+                _schema_ready = True
+    return conn
+
+def _rows(sql, params=()):
+    return [dict(r) for r in _conn().execute(sql, params)]
+
+# --- SETTINGS ---
+def get_settings():
+    try:
+        return {r["key"]: r["value"] for r in _conn().execute("SELECT key, value FROM settings")}
+    except Exception as e:
+        logger.error(f"Error fetching settings: {e}")
+        return {}
+
+def update_setting(key, value):
+    try:
+        _conn().execute("INSERT INTO settings (key, value) VALUES (?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, str(value)))
+        return True
+    except Exception as e:
+        logger.error(f"Error updating setting {key}: {e}")
+        return False
+
+# --- USED PROXIES ---
+def add_used_ip(ip, proxy, username="Unknown"):
+    try:
+        _conn().execute("INSERT OR IGNORE INTO used_proxies (ip, proxy, username) VALUES (?, ?, ?)", (ip, proxy, username))
+        return True
+    except Exception as e:
+        logger.error(f"Error adding used IP: {e}")
+        return False
+
+def delete_used_ip(ip):
+    try:
+        _conn().execute("DELETE FROM used_proxies WHERE ip = ?", (ip,))
+        return True
+    except Exception: return False
+
+def get_all_used_ips(limit=None):
+    try:
+        sql = "SELECT ip, proxy, created_at, username FROM used_proxies ORDER BY created_at DESC LIMIT ?"
+        return [{
+            "IP": r['ip'],
+            "Proxy": r['proxy'],
+            "Date": r['created_at'],
+            "User": r['username'] or 'Unknown'
+        } for r in _conn().execute(sql, (int(limit) if limit else -1,))]
+    except Exception: return []
+
+# --- BAD PROXIES ---
+def log_bad_proxy(proxy, ip, score):
+    try:
+        _conn().execute("INSERT OR IGNORE INTO bad_proxies (proxy, ip, score) VALUES (?, ?, ?)", (proxy, ip, score))
+        return True
+    except Exception: return False
+
+def get_bad_proxies_list():
+    try:
+        return _rows("SELECT ip, proxy FROM bad_proxies")
+    except Exception: return []
+
+# --- LOGS ---
+def add_log_entry(level, message, ip="N/A"):
+    try:
+        _conn().execute("INSERT INTO system_logs (level, message, ip) VALUES (?, ?, ?)", (level, message, ip))
+        return True
+    except Exception: return False
+
+def get_all_system_logs():
+    try:
+        return [{"Timestamp": r['created_at'], "Level": r['level'], "Message": r['message'], "IP": r['ip']}
+                for r in _conn().execute("SELECT * FROM system_logs ORDER BY created_at DESC LIMIT 200")]
+    except Exception: return []
+
+def clear_all_system_logs():
+    try:
+        _conn().execute("DELETE FROM system_logs")
+        return True
+    except Exception: return False
+
+# --- APP USERS ---
+def get_app_users():
+    return _rows("SELECT id, username, password_hash, role, can_fetch FROM app_users")
+
+# --- API USAGE & STATS ---
+def add_api_usage_log(username, ip, submitted_count, api_calls_count, good_proxies_count):
+    try:
+        _conn().execute(
+            "INSERT INTO api_usage (username, user_ip, submitted_count, api_calls_count, good_proxies_count) VALUES (?, ?, ?, ?, ?)",
+            (username, ip, submitted_count, api_calls_count, good_proxies_count))
+        return True
+    except Exception as e:
+        logger.error(f"Error logging usage: {e}")
+        return False
+
+def get_all_api_usage_logs():
+    try:
+        return _rows("SELECT * FROM api_usage")
+    except Exception: return []
+
+def get_user_stats_summary():
+    try:
+        return _rows("SELECT * FROM user_stats_view")
+    except Exception as e:
+        logger.error(f"Error fetching user stats: {e}")
+        return []
+
+def iter_export_rows(dataset, page_size=1000):
+    """Keyset-paged iteration over an export dataset (see db_util.EXPORT_TABLES)."""
+    from db_util import EXPORT_TABLES
+    table, columns = EXPORT_TABLES[dataset]
+    last_id = 0
+    while True:
+        try:
+            page = _rows(f"SELECT {', '.join(columns)} FROM {table} WHERE id > ? ORDER BY id LIMIT ?", (last_id, page_size))
+        except Exception as e:
+            logger.error(f"Export page error ({dataset} after id {last_id}): {e}")
+            raise
+        yield from page
+        if len(page) < page_size: return
+        last_id = page[-1]["id"]
+
+def get_daily_api_usage_for_user(username):
+    """Get total API calls for a user today"""
+    try:
+        today = datetime.utcnow().strftime("%Y-%m-%d")
+        row = _conn().execute(
+            "SELECT COALESCE(SUM(api_calls_count), 0) FROM api_usage WHERE username = ? AND created_at >= ?",
+            (username, today)).fetchone()
+        return int(row[0])
+    except Exception as e:
+        logger.error(f"Error getting daily API usage: {e}")
+        return 0
+
+def update_api_credits(used, remaining):
+    return update_setting("API_CREDITS_USED", used) and update_setting("API_CREDITS_REMAINING", remaining)
+
+# --- PROXY POOL FUNCTIONS ---
+def add_bulk_proxies(proxy_list, provider="manual"):
+    if not proxy_list: return 0
+    data = [(p.strip(), provider) for p in proxy_list if p.strip()]
+    try:
+        conn = _conn()
+        conn.execute("BEGIN")
+        conn.executemany("INSERT OR IGNORE INTO proxy_pool (proxy, provider) VALUES (?, ?)", data)
+        conn.execute("COMMIT")
+        return len(data)
+    except Exception as e:
+        logger.error(f"Error adding bulk proxies: {e}")
+        try: _conn().execute("ROLLBACK")
+        except Exception: pass
+        return 0
+
+def get_random_proxies_from_pool(limit=100):
+    try:
+        return [r[0] for r in _conn().execute("SELECT proxy FROM proxy_pool ORDER BY random() LIMIT ?", (limit,))]
+    except Exception as e:
+        logger.error(f"Error fetching from pool: {e}")
+        return []
+
+def get_pool_stats():
+    stats = {"total": 0, "pyproxy": 0, "piaproxy": 0}
+    try:
+        for provider, count in _conn().execute("SELECT provider, COUNT(*) FROM proxy_pool GROUP BY provider"):
+            stats["total"] += count
+            if provider in stats: stats[provider] = count
+    except Exception as e:
+        logger.error(f"Pool stats error: {e}")
+    return stats
+
+def get_pool_preview(provider, limit=50):
+    try:
+        return _rows("SELECT proxy, created_at FROM proxy_pool WHERE provider = ? ORDER BY created_at DESC LIMIT ?", (provider, limit))
+    except Exception as e:
+        logger.error(f"Preview fetch error: {e}")
+        return []
+
+def clear_proxy_pool(provider=None):
+    try:
+        if provider and provider != 'all':
+            _conn().execute("DELETE FROM proxy_pool WHERE provider = ?", (provider,))
+        else:
+            _conn().execute("DELETE FROM proxy_pool")
+        return True
+    except Exception as e:
+        logger.error(f"Error clearing pool: {e}")
+        return False
+
+def get_pool_batch(limit=200):
+    try:
+        return _rows("SELECT id, proxy, provider, fail_count FROM proxy_pool ORDER BY last_probe_at, id LIMIT ?", (limit,))
+    except Exception as e:
+        logger.error(f"Pool batch fetch error: {e}")
+        return []
+
+def mark_pool_probed(ids, fail_count):
+    if not ids: return 0
+    try:
+        conn = _conn()
+        conn.execute("BEGIN")
+        updated = conn.executemany(f"UPDATE proxy_pool SET fail_count = ?, last_probe_at = {_NOW} WHERE id = ?",
+                                   [(fail_count, i) for i in ids]).rowcount
+        conn.execute("COMMIT")
+        return updated
+    except Exception as e:
+        logger.error(f"Error marking pool proxies: {e}")
+        try: _conn().execute("ROLLBACK")
+        except Exception: pass
+        return 0
+
+def delete_pool_proxies(ids):
+    if not ids: return 0
+    try:
+        conn = _conn()
+        conn.execute("BEGIN")
+        deleted = conn.executemany("DELETE FROM proxy_pool WHERE id = ?", [(i,) for i in ids]).rowcount
+        conn.execute("COMMIT")
+        return deleted
+    except Exception as e:
+        logger.error(f"Error deleting pool proxies: {e}")
+        try: _conn().execute("ROLLBACK")
+        except Exception: pass
+        return 0
+
+def acquire_lease(name, owner, ttl):
+    key = f"LEASE_{name}"; now = time.time()
+    try:
+        conn = _conn()
+        conn.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, '')", (key,))
+        current = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()[0] or ""
+        holder, _, expires = current.partition("|")
+        if current and holder != owner and float(expires or 0) > now: return False
+        return conn.execute("UPDATE settings SET value = ? WHERE key = ? AND value = ?",
+                            (f"{owner}|{now + ttl}", key, current)).rowcount == 1
+    except Exception as e:
+        logger.error(f"Lease {name} error: {e}")
+        return False
@@ -1,30 +1,51 @@
 import os
 import logging
-from supabase import create_client, Client
 from datetime import datetime
-import pytz
 import random
 import time
+import queue
+import threading
 
 logger = logging.getLogger(__name__)
 
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
+# "supabase" (default) or "sqlite" for the embedded backend in db_sqlite.py
+DB_BACKEND = os.environ.get("DB_BACKEND", "supabase").strip().lower()
 
-try:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-except Exception as e:
-    logger.critical(f"Failed to initialize Supabase: {e}")
-    supabase = None
+_supabase = None
+_supabase_failed = False
+_supabase_lock = threading.Lock()
+
+def get_supabase():
+    """
+    Creates the Supabase client on first use. The supabase package is the most
+    expensive import in the app, so cold starts that never touch it skip it entirely.
+    Returns None when the client can't be created (or the SQLite backend is active).
+    """
+    global _supabase, _supabase_failed
+    if _supabase is not None or _supabase_failed or DB_BACKEND == "sqlite":
+        return _supabase
+    with _supabase_lock:
+        if _supabase is None and not _supabase_failed:
+            try:
+                from supabase import create_client
+                _supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+            except Exception as e:
+                logger.critical(f"Failed to initialize Supabase: {e}")
+                _supabase_failed = True
+    return _supabase
 
 def get_eat_time():
     """Get current time formatted for display."""
+    import pytz
     utc_now = datetime.utcnow()
     eat_timezone = pytz.timezone('Africa/Nairobi')
     return utc_now.replace(tzinfo=pytz.utc).astimezone(eat_timezone).strftime("%Y-%m-%d %H:%M:%S")
 
 # --- SETTINGS ---
 def get_settings():
+    supabase = get_supabase()
     if not supabase: return {}
     try:
         response = supabase.table('settings').select("*").execute()
@@ -34,6 +55,7 @@ def get_settings():
         return {}
 
 def update_setting(key, value):
+    supabase = get_supabase()
     if not supabase: return False
     try:
         supabase.table('settings').upsert({"key": key, "value": str(value)}).execute()
@@ -44,6 +66,7 @@ def update_setting(key, value):
 
 # --- USED PROXIES ---
 def add_used_ip(ip, proxy, username="Unknown"):
+    supabase = get_supabase()
     if not supabase: return False
     try:
         exists = supabase.table('used_proxies').select("id").eq("ip", ip).execute()
@@ -60,16 +83,20 @@ def add_used_ip(ip, proxy, username="Unknown"):
         return False
 
 def delete_used_ip(ip):
+    supabase = get_supabase()
     if not supabase: return False
     try:
         supabase.table('used_proxies').delete().eq("ip", ip).execute()
         return True
     except Exception: return False
 
-def get_all_used_ips():
+def get_all_used_ips(limit=None):
+    supabase = get_supabase()
     if not supabase: return []
     try:
-        response = supabase.table('used_proxies').select("ip, proxy, created_at, username").order("created_at", desc=True).execute()
+        query = supabase.table('used_proxies').select("ip, proxy, created_at, username").order("created_at", desc=True)
+        if limit: query = query.limit(limit)
+        response = query.execute()
         return [{
             "IP": r['ip'], 
             "Proxy": r['proxy'], 
@@ -80,6 +107,7 @@ def get_all_used_ips():
 
 # --- BAD PROXIES (FIXED) ---
 def log_bad_proxy(proxy, ip, score):
+    supabase = get_supabase()
     if not supabase: return False
     try:
         exists = supabase.table('bad_proxies').select("id").eq("ip", ip).execute()
@@ -90,6 +118,7 @@ def log_bad_proxy(proxy, ip, score):
     except Exception: return False
 
 def get_bad_proxies_list():
+    supabase = get_supabase()
     if not supabase: return []
     try:
         response = supabase.table('bad_proxies').select("ip, proxy").execute()
@@ -98,13 +127,38 @@ def get_bad_proxies_list():
 
 # --- LOGS ---
 def add_log_entry(level, message, ip="N/A"):
+    supabase = get_supabase()
     if not supabase: return False
     try:
         supabase.table('system_logs').insert({"level": level, "message": message, "ip": ip}).execute()
         return True
     except Exception: return False
 
+_LOG_QUEUE = queue.Queue(maxsize=1000)
+_log_worker = None
+
+def _drain_log_queue():
+    while True:
+        level, message, ip = _LOG_QUEUE.get()
+        add_log_entry(level, message, ip=ip)
+        _LOG_QUEUE.task_done()
+
+def add_log_entry_async(level, message, ip="N/A"):
+    """Queues a log entry for a background writer so the caller skips the DB round-trip."""
+    global _log_worker
+    if not get_supabase() and DB_BACKEND != "sqlite": return False
+    if _log_worker is None or not _log_worker.is_alive():
+        _log_worker = threading.Thread(target=_drain_log_queue, name="log-writer", daemon=True)
+        _log_worker.start()
+    try:
+        _LOG_QUEUE.put_nowait((level, message, ip))
+        return True
+    except queue.Full:
+        logger.warning(f"Log queue full, dropping: {message}")
+        return False
+
 def get_all_system_logs():
+    supabase = get_supabase()
     if not supabase: return []
     try:
         response = supabase.table('system_logs').select("*").order("created_at", desc=True).limit(200).execute()
@@ -112,14 +166,27 @@ def get_all_system_logs():
     except Exception: return []
 
 def clear_all_system_logs():
+    supabase = get_supabase()
     if not supabase: return False
     try:
         supabase.table('system_logs').delete().neq("id", 0).execute() 
         return True
     except Exception: return False
 
+# --- APP USERS ---
+def get_app_users():
+    """
+    Rows of the app_users table (id, username, password_hash, role, can_fetch).
+    Raises on failure so callers can tell an outage from an empty table.
+    """
+    supabase = get_supabase()
+    if not supabase: raise RuntimeError("Supabase client unavailable")
+    response = supabase.table('app_users').select("id, username, password_hash, role, can_fetch").execute()
+    return response.data
+
 # --- API USAGE & STATS ---
 def add_api_usage_log(username, ip, submitted_count, api_calls_count, good_proxies_count):
+    supabase = get_supabase()
     if not supabase: return False
     try:
         supabase.table('api_usage').insert({
@@ -135,6 +202,7 @@ def add_api_usage_log(username, ip, submitted_count, api_calls_count, good_proxi
         return False
 
 def get_all_api_usage_logs():
+    supabase = get_supabase()
     if not supabase: return []
     try:
         response = supabase.table('api_usage').select("*").execute()
@@ -142,6 +210,7 @@ def get_all_api_usage_logs():
     except Exception: return []
 
 def get_user_stats_summary():
+    supabase = get_supabase()
     if not supabase: return []
     try:
         response = supabase.table('user_stats_view').select("*").execute()
@@ -150,9 +219,39 @@ def get_user_stats_summary():
         logger.error(f"Error fetching user stats: {e}")
         return []
 
+# --- EXPORTS ---
+# Tables (and columns) that can be exported; keys are the names used in export URLs
+EXPORT_TABLES = {
+    "used-ips": ("used_proxies", ["id", "ip", "proxy", "username", "created_at"]),
+    "bad-proxies": ("bad_proxies", ["id", "ip", "proxy", "score", "created_at"]),
+    "api-usage": ("api_usage", ["id", "username", "user_ip", "submitted_count", "api_calls_count", "good_proxies_count", "created_at"]),
+}
+
+def iter_export_rows(dataset, page_size=1000):
+    """
+    Yields every row of an EXPORT_TABLES dataset in id order, one page at a time
+    using a keyset cursor (id > last seen id), so memory stays flat for any table size.
+    A failed page fetch raises, so a partial export is never mistaken for a complete one.
+    """
+    table, columns = EXPORT_TABLES[dataset]
+    supabase = get_supabase()
+    if not supabase: raise RuntimeError("Supabase client unavailable")
+    last_id = 0
+    while True:
+        try:
+            page = supabase.table(table).select(", ".join(columns)).gt("id", last_id).order("id").limit(page_size).execute().data
+        except Exception as e:
+            logger.error(f"Export page error ({dataset} after id {last_id}): {e}")
+            raise
+        for row in page:
+            yield row
+        if len(page) < page_size: return
+        last_id = page[-1]["id"]
+
 # --- DAILY API USAGE TRACKING ---
 def get_daily_api_usage_for_user(username):
     """Get total API calls for a user today"""
+    supabase = get_supabase()
     if not supabase: return 0
     try:
         today = datetime.utcnow().strftime("%Y-%m-%d")
@@ -169,6 +268,7 @@ def get_daily_api_usage_for_user(username):
 
 # --- API CREDITS MANAGEMENT ---
 def update_api_credits(used, remaining):
+    supabase = get_supabase()
     if not supabase: return False
     try:
         supabase.table('settings').upsert({"key": "API_CREDITS_USED", "value": str(used)}).execute()
@@ -181,6 +281,7 @@ def update_api_credits(used, remaining):
 # --- PROXY POOL FUNCTIONS ---
 
 def add_bulk_proxies(proxy_list, provider="manual"):
+    supabase = get_supabase()
     if not supabase or not proxy_list: return 0
     data = [{"proxy": p.strip(), "provider": provider} for p in proxy_list if p.strip()]
     total_added = 0; chunk_size = 1000
@@ -193,6 +294,7 @@ def add_bulk_proxies(proxy_list, provider="manual"):
     return total_added
 
 def get_random_proxies_from_pool(limit=100):
+    supabase = get_supabase()
     if not supabase: return []
     try:
         response = supabase.rpc('get_random_proxies', {'limit_count': limit}).execute()
@@ -204,6 +306,7 @@ def get_random_proxies_from_pool(limit=100):
 
 def get_pool_stats():
     """Fetches counts robustly using limit(1) to ensure count is returned."""
+    supabase = get_supabase()
     if not supabase: return {"total": 0, "pyproxy": 0, "piaproxy": 0}
     stats = {"total": 0, "pyproxy": 0, "piaproxy": 0}
     
@@ -228,6 +331,7 @@ def get_pool_stats():
 
 def get_pool_preview(provider, limit=50):
     """Fetches a preview list of proxies for a provider"""
+    supabase = get_supabase()
     if not supabase: return []
     try:
         res = supabase.table('proxy_pool').select("proxy, created_at").eq('provider', provider).order('created_at', desc=True).limit(limit).execute()
@@ -237,6 +341,7 @@ def get_pool_preview(provider, limit=50):
         return []
 
 def clear_proxy_pool(provider=None):
+    supabase = get_supabase()
     if not supabase: return False
     try:
         query = supabase.table('proxy_pool').delete()
@@ -247,3 +352,78 @@ def clear_proxy_pool(provider=None):
         query.execute()
         return True
     except Exception as e: logger.error(f"Error clearing pool: {e}"); return False
+
+# --- POOL RECYCLER ---
+# proxy_pool needs two extra columns for this:
+#   fail_count integer not null default 0, last_probe_at timestamptz (null = never probed)
+
+def get_pool_batch(limit=200):
+    """Pool rows least recently probed first (never-probed first, then by id), for the recycler."""
+    supabase = get_supabase()
+    if not supabase: return []
+    try:
+        res = supabase.table('proxy_pool').select("id, proxy, provider, fail_count") \
+            .order('last_probe_at', nullsfirst=True).order('id').limit(limit).execute()
+        return res.data
+    except Exception as e:
+        logger.error(f"Pool batch fetch error: {e}")
+        return []
+
+def mark_pool_probed(ids, fail_count):
+    """Sets fail_count and stamps last_probe_at on pool rows, in chunks. Returns the number updated."""
+    supabase = get_supabase()
+    if not supabase or not ids: return 0
+    now = datetime.utcnow().isoformat() + "+00:00"
+    updated = 0; chunk_size = 500
+    for i in range(0, len(ids), chunk_size):
+        chunk = list(ids[i:i + chunk_size])
+        try:
+            supabase.table('proxy_pool').update({"fail_count": fail_count, "last_probe_at": now}).in_('id', chunk).execute()
+            updated += len(chunk)
+        except Exception as e: logger.error(f"Error marking pool proxies: {e}")
+    return updated
+
+def acquire_lease(name, owner, ttl):
+    """
+    Cross-process lease stored in settings as "owner|expires_at". Taken with a
+    compare-and-set update, so only one worker wins; the holder may renew it.
+    """
+    supabase = get_supabase()
+    if not supabase: return False
+    key = f"LEASE_{name}"; now = time.time()
+    try:
+        res = supabase.table('settings').select("value").eq('key', key).execute()
+        if not res.data:
+            supabase.table('settings').upsert({"key": key, "value": ""}, on_conflict='key', ignore_duplicates=True).execute()
+            current = ""
+        else:
+            current = res.data[0]['value'] or ""
+        holder, _, expires = current.partition("|")
+        if current and holder != owner and float(expires or 0) > now: return False
+        res = supabase.table('settings').update({"value": f"{owner}|{now + ttl}"}).eq('key', key).eq('value', current).execute()
+        return bool(res.data)
+    except Exception as e:
+        logger.error(f"Lease {name} error: {e}")
+        return False
+
+def delete_pool_proxies(ids):
+    """Deletes pool rows by id in chunks; returns the number of ids submitted successfully."""
+    supabase = get_supabase()
+    if not supabase or not ids: return 0
+    deleted = 0; chunk_size = 500
+    for i in range(0, len(ids), chunk_size):
+        chunk = list(ids[i:i + chunk_size])
+        try:
+            supabase.table('proxy_pool').delete().in_('id', chunk).execute()
+            deleted += len(chunk)
+        except Exception as e: logger.error(f"Error deleting pool proxies: {e}")
+    return deleted
+
+# --- BACKEND SELECTION ---
+# With DB_BACKEND=sqlite every storage function above is replaced by its db_sqlite
+# equivalent (same signature and return shape); helpers here then call through to it.
+if DB_BACKEND == "sqlite":
+    import db_sqlite
+    for _name in db_sqlite.__all__:
+        globals()[_name] = getattr(db_sqlite, _name)
+    logger.info(f"Using SQLite storage at {db_sqlite.SQLITE_PATH}")
@@ -0,0 +1,151 @@
+"""
+Geo-indexed inventory of verified proxies. Good proxies that a check found but did
+not hand out are kept here by state, so a later request for that state can be
+served without a live check. Each proxy is handed out at most once.
+"""
+import os
+import logging
+import re
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_DB_PATH = os.environ.get("GEO_INVENTORY_DB", "/tmp/geo_inventory.db")
+INVENTORY_TTL = 1800   # verified proxies older than this are not served (sessions rotate)
+
+US_STATE_ABBR = {
+    "al": "alabama", "ak": "alaska", "az": "arizona", "ar": "arkansas", "ca": "california",
+    "co": "colorado", "ct": "connecticut", "de": "delaware", "fl": "florida", "ga": "georgia",
+    "hi": "hawaii", "id": "idaho", "il": "illinois", "in": "indiana", "ia": "iowa",
+    "ks": "kansas", "ky": "kentucky", "la": "louisiana", "me": "maine", "md": "maryland",
+    "ma": "massachusetts", "mi": "michigan", "mn": "minnesota", "ms": "mississippi", "mo": "missouri",
+    "mt": "montana", "ne": "nebraska", "nv": "nevada", "nh": "newhampshire", "nj": "newjersey",
+    "nm": "newmexico", "ny": "newyork", "nc": "northcarolina", "nd": "northdakota", "oh": "ohio",
+    "ok": "oklahoma", "or": "oregon", "pa": "pennsylvania", "ri": "rhodeisland", "sc": "southcarolina",
+    "sd": "southdakota", "tn": "tennessee", "tx": "texas", "ut": "utah", "vt": "vermont",
+    "va": "virginia", "wa": "washington", "wv": "westvirginia", "wi": "wisconsin", "wy": "wyoming",
+    "dc": "districtofcolumbia",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS geo_inventory (
+    proxy TEXT PRIMARY KEY,
+    ip TEXT NOT NULL,
+    state_key TEXT NOT NULL,
+    country_code TEXT,
+    state TEXT,
+    city TEXT,
+    postcode TEXT,
+    score INTEGER,
+    strict INTEGER NOT NULL DEFAULT 0,
+    verified_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_geo_inventory_state ON geo_inventory(state_key, verified_at);
+"""
+
+_initialized = False
+
+def _connect():
+    global _initialized
+    conn = sqlite3.connect(INVENTORY_DB_PATH, timeout=5)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        try: conn.execute("ALTER TABLE geo_inventory ADD COLUMN strict INTEGER NOT NULL DEFAULT 0")  # pre-strict tables
+        except sqlite3.OperationalError: pass
+        _initialized = True
+    return conn
+
+def state_key(state):
+    """'TX', 'Texas' and 'texas' all map to 'texas'; 'New York' to 'newyork' (the fetch UI's keys)."""
+    key = re.sub(r"[^a-z]", "", str(state or "").lower())
+    return US_STATE_ABBR.get(key, key)
+
+def known_state_key(state):
+    """state_key() for a real geo lookup; None when the state is missing or a placeholder (N/A, ERR)."""
+    if not state or str(state).strip().upper() in ("N/A", "ERR"): return None
+    return state_key(state) or None
+
+def add_verified(results, is_strict_mode=True):
+    """
+    Stores good CheckResults (with geo) for later requests, with their score and
+    whether they passed strict mode. Returns the number stored.
+    """
+    now = time.time()
+    rows = []
+    for r in results:
+        geo = r.geo
+        key = known_state_key(geo.state) if geo else None
+        if not r.proxy or not r.ip or not key:
+            continue
+        rows.append((r.proxy, r.ip, key, geo.country_code, geo.state, geo.city, geo.postcode, r.score, int(bool(is_strict_mode)), now))
+    if not rows: return 0
+    try:
+        conn = _connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO geo_inventory (proxy, ip, state_key, country_code, state, city, postcode, score, strict, verified_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.close()
+        return len(rows)
+    except Exception as e:
+        logger.error(f"Error storing geo inventory: {e}")
+        return 0
+
+def take_proxies(state, limit, exclude=None, fraud_score_level=None, is_strict_mode=True):
+    """
+    Claims up to limit fresh proxies for a state (freshest first) and removes them
+    from the inventory. Rows whose IP matches exclude(ip) (used or since marked bad)
+    are dropped as well since they can never be served. Only rows at or under the
+    caller's fraud_score_level, and checked in strict mode when the caller is
+    strict, are claimed; the rest stay for other callers.
+    Returns result dicts shaped like CheckResult.to_dict().
+    """
+    key = state_key(state)
+    if not key or limit <= 0: return []
+    taken, discard = [], []
+    try:
+        conn = _connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cur = conn.execute(
+                "SELECT proxy, ip, country_code, state, city, postcode, score, verified_at FROM geo_inventory "
+                "WHERE state_key = ? AND verified_at >= ? AND (? = 0 OR strict = 1) "
+                "AND (? IS NULL OR (score IS NOT NULL AND score <= ?)) ORDER BY verified_at DESC",
+                (key, time.time() - INVENTORY_TTL, int(bool(is_strict_mode)), fraud_score_level, fraud_score_level))
+            for proxy, ip, cc, st, city, pc, score, verified_at in cur:
+                if exclude and exclude(ip):
+                    discard.append(proxy)
+                    continue
+                taken.append({
+                    "proxy": proxy, "ip": ip, "score": score, "status": "success", "used": False,
+                    "cached_bad": False, "unstable": False, "latency": None, "from_inventory": True,
+                    "verified_age": round(time.time() - verified_at),
+                    "geo": {"country_code": cc, "state": st, "city": city, "postcode": pc},
+                })
+                if len(taken) >= limit: break
+            gone = [t["proxy"] for t in taken] + discard
+            if gone:
+                conn.executemany("DELETE FROM geo_inventory WHERE proxy = ?", [(p,) for p in gone])
+        conn.close()
+    except Exception as e:
+        logger.error(f"Error reading geo inventory: {e}")
+        return []
+    return taken
+
+def state_counts():
+    """{state: {"count", "newest_age"}} of fresh inventory, largest first; drops expired rows."""
+    out = {}
+    try:
+        conn = _connect()
+        now = time.time()
+        with conn:
+            conn.execute("DELETE FROM geo_inventory WHERE verified_at < ?", (now - INVENTORY_TTL,))
+        for st, count, newest in conn.execute(
+                "SELECT MAX(state), COUNT(*), MAX(verified_at) FROM geo_inventory GROUP BY state_key ORDER BY COUNT(*) DESC"):
+            out[st] = {"count": count, "newest_age": round(now - newest)}
+        conn.close()
+    except Exception as e:
+        logger.error(f"Error counting geo inventory: {e}")
+    return out
@@ -0,0 +1,257 @@
+"""
+Exit-IP detection through a proxy. Requests are raced across several IP echo
+endpoints and the first valid answer wins; per-endpoint latency and error rates
+are tracked so slow or failing endpoints drop out of the race.
+
+IP_ECHO_ENDPOINTS=url1,url2,...  echo services to use (a self-hosted one can be
+                                 run with `python ip_echo.py --port 8099`)
+IP_ECHO_RACE=2                   endpoints queried in parallel per probe
+IP_ECHO_MAX_WORKERS=64           threads shared by all probes in the process; a probe's
+                                 timeout starts when a thread picks it up
+"""
+import ipaddress
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from startup import LazyModule
+
+requests = LazyModule("requests")
+urllib3 = LazyModule("urllib3")
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENDPOINTS = [
+    "https://ipv4.icanhazip.com",
+    "https://api.ipify.org",
+    "https://checkip.amazonaws.com",
+    "https://ifconfig.me/ip",
+]
+ECHO_ENDPOINTS = [u.strip() for u in os.environ.get("IP_ECHO_ENDPOINTS", "").split(",") if u.strip()] or DEFAULT_ENDPOINTS
+ECHO_RACE = max(1, int(os.environ.get("IP_ECHO_RACE", 2)))
+ECHO_MAX_WORKERS = int(os.environ.get("IP_ECHO_MAX_WORKERS", 64))
+EXPLORE_RATE = 0.1      # share of probes that also race a lower-ranked endpoint, so its stats stay current
+ERROR_COOLDOWN = 60     # seconds an endpoint sits out after 3 consecutive errors
+EWMA_ALPHA = 0.2
+QUEUE_POLL = 0.05       # how often a caller re-checks probes still waiting for an executor thread
+
+# --- ENDPOINT STATS ---
+class EndpointStats:
+    __slots__ = ("url", "latency", "error_rate", "successes", "errors", "streak", "cooldown_until", "last_error")
+
+    def __init__(self, url):
+        self.url = url
+        self.latency = None       # EWMA of successful response time (s)
+        self.error_rate = 0.0     # EWMA of failures (0..1)
+        self.successes = 0
+        self.errors = 0
+        self.streak = 0
+        self.cooldown_until = 0
+        self.last_error = None
+
+    def score(self):
+        """Lower is better: expected latency inflated by the recent error rate."""
+        latency = self.latency if self.latency is not None else 1.0
+        return latency * (1 + 4 * self.error_rate)
+
+    def to_dict(self):
+        return {
+            "url": self.url,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "successes": self.successes,
+            "errors": self.errors,
+            "cooling_down": self.cooldown_until > time.time(),
+            "last_error": self.last_error,
+        }
+
+_stats = {url: EndpointStats(url) for url in ECHO_ENDPOINTS}
+_stats_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+def _record(url, latency=None, error=None):
+    with _stats_lock:
+        s = _stats.setdefault(url, EndpointStats(url))
+        if error is None:
+            s.successes += 1
+            s.streak = 0
+            s.latency = latency if s.latency is None else (1 - EWMA_ALPHA) * s.latency + EWMA_ALPHA * latency
+            s.error_rate *= (1 - EWMA_ALPHA)
+        else:
+            s.errors += 1
+            s.streak += 1
+            s.last_error = error
+            s.error_rate = (1 - EWMA_ALPHA) * s.error_rate + EWMA_ALPHA
+            if s.streak >= 3:
+                s.cooldown_until = time.time() + ERROR_COOLDOWN
+
+def ranked_endpoints(endpoints=None):
+    """Endpoints best-first; ones in cooldown go last rather than being dropped."""
+    now = time.time()
+    with _stats_lock:
+        stats = [_stats.setdefault(u, EndpointStats(u)) for u in (endpoints or ECHO_ENDPOINTS)]
+        return [s.url for s in sorted(stats, key=lambda s: (s.cooldown_until > now, s.score()))]
+
+def get_endpoint_stats():
+    with _stats_lock:
+        return [s.to_dict() for s in _stats.values()]
+
+def reset_endpoint_stats():
+    with _stats_lock:
+        for url in list(_stats):
+            _stats[url] = EndpointStats(url)
+
+# --- DETECTION ---
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=ECHO_MAX_WORKERS, thread_name_prefix="ip-echo")
+    return _executor
+
+def parse_echo(text):
+    """Returns the IPv4 address an echo endpoint answered with, or None."""
+    try:
+        return str(ipaddress.IPv4Address(text.strip()))
+    except (ValueError, AttributeError):
+        return None
+
+# Returned by _probe when the proxy itself failed; no other endpoint can do better
+PROXY_FAILED = object()
+
+def _wrapped_errors(exc):
+    """exc and every error it wraps (requests -> urllib3 -> socket)."""
+    stack, seen = [exc], []
+    while stack:
+        e = stack.pop()
+        if not isinstance(e, BaseException) or any(e is s for s in seen): continue
+        seen.append(e)
+        stack += [*e.args, getattr(e, "reason", None), getattr(e, "original_error", None), e.__cause__, e.__context__]
+    return seen
+
+def _is_proxy_failure(exc, proxies):
+    """
+    Errors the proxy itself is to blame for: auth rejected (407) or the TCP
+    connection to the proxy refused or timing out. A tunnel the proxy answers
+    with 5xx means it couldn't reach the echo host, which is the endpoint's fault.
+    """
+    if not proxies: return False
+    for e in _wrapped_errors(exc):
+        # NewConnectionError (refused, unresolvable proxy host) subclasses ConnectTimeoutError
+        if isinstance(e, (urllib3.exceptions.ConnectTimeoutError, requests.exceptions.ConnectTimeout, ConnectionRefusedError)):
+            return True
+        if isinstance(e, OSError) and str(e).startswith("Tunnel connection failed: 407"):
+            return True
+    return False
+
+def _probe(url, proxies, timeout, headers, starts=None):
+    if starts is not None: starts[url] = time.monotonic()   # the timeout runs from here, not from submit()
+    started = time.perf_counter()
+    try:
+        response = requests.get(url, proxies=proxies, timeout=timeout, headers=headers)
+        if response.status_code == 407: return PROXY_FAILED
+        response.raise_for_status()
+        ip = parse_echo(response.text)
+        if not ip:
+            raise ValueError("response is not an IPv4 address")
+    except Exception as e:
+        if _is_proxy_failure(e, proxies): return PROXY_FAILED
+        _record(url, error=f"{type(e).__name__}: {str(e)[:120]}")
+        return None
+    _record(url, latency=time.perf_counter() - started)
+    return ip
+
+def proxies_for(proxy_line):
+    """requests proxies dict for a host:port:user:pass line."""
+    host, port, user, pw = proxy_line.strip().split(":")
+    url = f"http://{user}:{pw}@{host}:{port}"
+    return {"http": url, "https": url}
+
+def detect_exit_ip(proxies, timeout=4, headers=None, endpoints=None, race=None, failed_endpoints=None):
+    """
+    Exit IP seen through proxies (a requests proxies dict), or None.
+    The best `race` endpoints are queried at once; each time one fails the next
+    ranked endpoint joins, until one answers or the timeout runs out. The
+    timeout counts from when a probe thread picks the work up, so a busy pool
+    delays the answer instead of failing it. Late answers from losing requests
+    still update the endpoint stats. A proxy-side failure (407, proxy refused or timing out) stops further endpoints from
+    joining and is not counted against the endpoint; racers already in flight
+    still get to answer. If failed_endpoints is a list, the endpoints that
+    errored or ran out of time are appended to it.
+    """
+    order = ranked_endpoints(endpoints)
+    race = min(race or ECHO_RACE, len(order))
+    if race < len(order) and random.random() < EXPLORE_RATE:
+        # Swap a random lower-ranked endpoint into the last racing slot
+        j = random.randrange(race, len(order))
+        order[race - 1], order[j] = order[j], order[race - 1]
+    executor = _get_executor()
+    starts, budgets = {}, {}      # url -> when a thread picked the probe up / seconds it has from then
+    queue = list(order)
+    pending = {}
+    while queue or pending:
+        # The budget runs from the first pickup: time spent queued behind other probes is not the proxy's
+        first = min(starts.copy().values(), default=None)
+        remaining = timeout if first is None else first + timeout - time.monotonic()
+        while queue and len(pending) < race and remaining > 0:
+            url = queue.pop(0)
+            budgets[url] = remaining
+            pending[executor.submit(_probe, url, proxies, remaining, headers, starts)] = url
+        if not pending: break
+        # A probe still waiting for a thread has no deadline yet, so keep polling until it starts
+        deadlines = [starts[u] + budgets[u] if u in starts else None for u in pending.values()]
+        wait_for = QUEUE_POLL if None in deadlines else max(deadlines) - time.monotonic()
+        if wait_for <= 0: break
+        done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in done:
+            url = pending.pop(future)
+            ip = future.result()
+            if ip is PROXY_FAILED: queue.clear()
+            elif ip: return ip
+            elif failed_endpoints is not None: failed_endpoints.append(url)
+    if failed_endpoints is not None: failed_endpoints.extend(pending.values())
+    return None
+
+# --- LOCAL ECHO SERVER ---
+def serve(host="127.0.0.1", port=0, background=True):
+    """
+    Runs a minimal echo endpoint that answers with the caller's address, for
+    self-hosting or as a stand-in for the public services in local testing.
+    Returns the server; its URL is f"http://{host}:{server.server_port}".
+    """
+    # Only the dev server needs http.server; keep it off the app's import path
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class EchoHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = f"{self.client_address[0]}\n".encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), EchoHandler)
+    server.daemon_threads = True
+    if background:
+        threading.Thread(target=server.serve_forever, name="ip-echo-server", daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Self-hosted IP echo endpoint")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args()
+    print(f"IP echo listening on http://{args.host}:{args.port}")
+    serve(args.host, args.port, background=False)
@@ -0,0 +1,103 @@
+"""
+Bad-IP rule engine. Single IPs and CIDR blocks are compiled into sorted, merged
+IPv4 integer ranges held in two arrays, so a lookup is one binary search and a
+batch lookup is a single merge pass over the sorted queries.
+"""
+import ipaddress
+import logging
+import re
+import threading
+from array import array
+from bisect import bisect_right
+
+logger = logging.getLogger(__name__)
+
+def parse_rules(text):
+    """Splits admin input (commas, whitespace or newlines; '#' comments) into rule strings."""
+    rules = []
+    for line in (text or "").splitlines():
+        line = line.split("#", 1)[0]
+        rules.extend(r for r in re.split(r"[,\s]+", line) if r)
+    return rules
+
+class IPRuleIndex:
+    def __init__(self, rules=()):
+        ranges = []
+        self._other = set()  # IPv6 and anything else we can't range-index
+        for rule in rules:
+            rule = str(rule).strip()
+            if not rule: continue
+            if "/" not in rule and ":" not in rule:
+                # Plain IPv4 address (the bulk of the bad list): skip the network parser
+                try:
+                    n = int(ipaddress.IPv4Address(rule))
+                    ranges.append((n, n))
+                    continue
+                except ValueError:
+                    pass
+            try:
+                net = ipaddress.ip_network(rule, strict=False)
+            except ValueError:
+                logger.warning(f"Ignoring invalid IP rule: {rule}")
+                continue
+            if net.version == 4:
+                ranges.append((int(net.network_address), int(net.broadcast_address)))
+            else:
+                self._other.add(net)
+        ranges.sort()
+
+        self._starts = array("L")
+        self._ends = array("L")
+        for start, end in ranges:
+            if self._ends and start <= self._ends[-1] + 1:
+                if end > self._ends[-1]: self._ends[-1] = end
+            else:
+                self._starts.append(start)
+                self._ends.append(end)
+        self._added = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._starts) + len(self._other) + len(self._added)
+
+    @staticmethod
+    def _to_int(ip):
+        ip = str(ip).strip()
+        try:
+            if ":" not in ip: return int(ipaddress.IPv4Address(ip))
+            return ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+
+    def _match_other(self, addr):
+        return any(addr in net for net in self._other)
+
+    def add(self, ip):
+        """Adds one IP without recompiling (e.g. a score just logged as bad)."""
+        with self._lock:
+            self._added.add(str(ip).strip())
+
+    def __contains__(self, ip):
+        key = self._to_int(ip)
+        if key is None: return False
+        if str(ip).strip() in self._added: return True
+        if not isinstance(key, int): return self._match_other(key)
+        i = bisect_right(self._starts, key) - 1
+        return i >= 0 and key <= self._ends[i]
+
+    def contains_many(self, ips):
+        """Batch lookup; returns a list of bools aligned with ips."""
+        keys = [self._to_int(ip) for ip in ips]
+        out = [False] * len(keys)
+        order = sorted((k, n) for n, k in enumerate(keys) if isinstance(k, int))
+        i, count = 0, len(self._starts)
+        for key, n in order:
+            while i < count and self._ends[i] < key:
+                i += 1
+            if i < count and self._starts[i] <= key:
+                out[n] = True
+        for n, (ip, key) in enumerate(zip(ips, keys)):
+            if key is None or out[n]: continue
+            if str(ip).strip() in self._added or (not isinstance(key, int) and self._match_other(key)):
+                out[n] = True
+        return out
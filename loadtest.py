@@ -0,0 +1,316 @@
+"""
+Load generator for the request path. Runs the real Flask app against the SQLite
+backend (with an injected per-call delay standing in for Supabase round-trips)
+and fake exit-IP / Scamalytics upstreams, then drives `/`, `/api/fetch-pool-proxies`
+and `/track-used` from concurrent logged-in users.
+
+    python loadtest.py                               # mixed scenario, Flask test client
+    python loadtest.py --scenario all --users 20     # every scenario in turn
+    python loadtest.py --gunicorn --workers 2        # same traffic over HTTP to a local gunicorn
+    python loadtest.py --max-p95-ms 800 --max-error-rate 0.01   # exit 1 on regression
+
+Reports requests/sec, latency percentiles and error rate per route.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Routes: name -> (method, path)
+ROUTES = {
+    "GET /": ("GET", "/"),
+    "POST / (check)": ("POST", "/"),
+    "GET /api/fetch-pool-proxies": ("GET", "/api/fetch-pool-proxies"),
+    "POST /track-used": ("POST", "/track-used"),
+}
+
+# Scenario -> {route: weight}
+SCENARIOS = {
+    "mixed": {"GET /": 3, "POST / (check)": 1, "GET /api/fetch-pool-proxies": 4, "POST /track-used": 4},
+    "fetch-heavy": {"GET /api/fetch-pool-proxies": 8, "GET /": 1, "POST /track-used": 1},
+    "track-heavy": {"POST /track-used": 8, "GET /api/fetch-pool-proxies": 2},
+    "check-heavy": {"POST / (check)": 6, "GET /": 2, "GET /api/fetch-pool-proxies": 2},
+}
+
+USERS = [("Work2", "password"), ("EL", "ADMIN123")]
+POOL_SEED = 2000
+CHECK_BATCH = 5
+
+def _env_ms(name, default):
+    return float(os.environ.get(name, default)) / 1000.0
+
+# --- STUBBED ENVIRONMENT ---
+def prepare_environment(workdir=None):
+    """Points every local store at a scratch directory; must run before db_util/app are imported."""
+    workdir = workdir or os.environ.get("LOADTEST_DIR") or tempfile.mkdtemp(prefix="proxy-loadtest-")
+    os.environ["LOADTEST_DIR"] = workdir
+    os.environ["DB_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = os.path.join(workdir, "app.db")
+    os.environ["PROXY_HEALTH_DB"] = os.path.join(workdir, "health.db")
+    os.environ["GEO_INVENTORY_DB"] = os.path.join(workdir, "geo.db")
+    os.environ.setdefault("FLASK_SECRET_KEY", "loadtest")
+    os.environ.pop("WARM_SNAPSHOT_PATH", None)
+    os.environ.pop("POOL_RECYCLER", None)
+    return workdir
+
+def seed(pool_size=POOL_SEED):
+    import db_util
+    db_util.update_setting("SCAMALYTICS_API_KEY", "loadtest")
+    db_util.update_setting("SCAMALYTICS_USERNAME", "loadtest")
+    db_util.update_setting("SCAMALYTICS_API_URL", "http://scamalytics.loadtest.invalid")
+    db_util.add_bulk_proxies([f"gate.loadtest.invalid:{10000 + i}:user-{i}:pw" for i in range(pool_size)], "pyproxy")
+
+def _fake_ip(proxy_line):
+    digest = hashlib.md5(proxy_line.encode()).digest()
+    return f"{10 + digest[0] % 200}.{digest[1]}.{digest[2]}.{digest[3] or 1}"
+
+def _install_stubs(db_latency, upstream_latency):
+    """Delays every storage call and replaces the network-facing check helpers."""
+    import db_util
+    import db_sqlite
+
+    def delayed(fn):
+        def call(*args, **kwargs):
+            time.sleep(db_latency)
+            return fn(*args, **kwargs)
+        call.__name__ = fn.__name__
+        return call
+    if db_latency > 0:
+        for name in db_sqlite.__all__:
+            setattr(db_util, name, delayed(getattr(db_util, name)))
+
+    import app as app_module
+
+    def get_ip_from_proxy(proxy_line, deadline=None):
+        time.sleep(upstream_latency * random.uniform(0.5, 1.5))
+        return _fake_ip(proxy_line)
+
+    def get_fraud_score_detailed(ip, proxy_line, credentials_list, deadline=None):
+        time.sleep(upstream_latency * random.uniform(0.5, 1.5))
+        return {
+            "scamalytics": {"status": "ok", "scamalytics_score": int(ip.split(".")[1]) % 100,
+                            "credits": {"used": 1, "remaining": 100000}},
+            "external_datasources": {"maxmind_geolite2": {"ip_country_code": "US", "ip_state_name": "Texas",
+                                                          "ip_city": "Austin", "ip_postcode": "73301"}},
+        }
+    app_module.get_ip_from_proxy = get_ip_from_proxy
+    app_module.get_fraud_score_detailed = get_fraud_score_detailed
+    return app_module
+
+def build_app():
+    """WSGI factory for gunicorn ("loadtest:build_app()"): the app with stubs installed."""
+    prepare_environment()
+    app_module = _install_stubs(_env_ms("LOADTEST_DB_LATENCY_MS", 20), _env_ms("LOADTEST_UPSTREAM_LATENCY_MS", 50))
+    logging.disable(logging.INFO)  # per-request app logs would dominate the run
+    return app_module.app
+
+# --- CLIENTS ---
+class TestClientSession:
+    """One logged-in user on the in-process Flask test client."""
+    def __init__(self, app, username, password):
+        self.client = app.test_client()
+        self.client.post("/login", data={"username": username, "password": password})
+
+    def request(self, method, path, **kwargs):
+        r = self.client.open(path, method=method, **kwargs)
+        body = r.get_data()
+        return r.status_code, (r.get_json(silent=True) if r.is_json else None), body
+
+class HttpSession:
+    """One logged-in user against a running server."""
+    def __init__(self, base_url, username, password):
+        import requests
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.session.post(f"{base_url}/login", data={"username": username, "password": password}, timeout=30)
+
+    def request(self, method, path, data=None, json=None):
+        r = self.session.request(method, self.base_url + path, data=data, json=json, timeout=60, allow_redirects=False)
+        try: payload = r.json() if "json" in r.headers.get("Content-Type", "") else None
+        except ValueError: payload = None
+        return r.status_code, payload, r.content
+
+def _do_route(session, route, state):
+    """Issues one request; returns True if the response counts as a success."""
+    method, path = ROUTES[route]
+    if route == "POST / (check)":
+        proxies = state.get("fetched") or [f"gate.loadtest.invalid:{random.randint(10000, 60000)}:user-{random.random():.8f}:pw"
+                                           for _ in range(CHECK_BATCH)]
+        status, _, body = session.request(method, path, data={"proxytext": "\n".join(proxies[:CHECK_BATCH])})
+        return status == 200 and b"good proxies" in body
+    if route == "GET /api/fetch-pool-proxies":
+        status, payload, _ = session.request(method, path)
+        if payload and payload.get("proxies"): state["fetched"] = payload["proxies"]
+        return status == 200 and bool(payload) and payload.get("status") == "success"
+    if route == "POST /track-used":
+        proxy = random.choice(state.get("fetched") or [f"gate.loadtest.invalid:10000:user-{random.random():.8f}:pw"])
+        ip = f"100.{random.randint(64, 127)}.{random.randint(0, 255)}.{random.randint(1, 254)}"
+        status, payload, _ = session.request(method, path, json={"proxy": proxy, "ip": ip})
+        return status == 200 and bool(payload) and payload.get("status") == "success"
+    status, _, _ = session.request(method, path)
+    return status == 200
+
+# --- RUNNER ---
+def run_scenario(make_session, scenario, users, duration, warmup=0):
+    weights = SCENARIOS[scenario]
+    routes, route_weights = list(weights), list(weights.values())
+    samples = {route: [] for route in routes}     # (latency, ok)
+    lock = threading.Lock()
+    start_gate = threading.Barrier(users + 1)
+    window = {}
+
+    def user_loop(n):
+        username, password = USERS[n % len(USERS)]
+        try:
+            session = make_session(username, password)
+        except Exception:
+            session = None
+        state = {}
+        start_gate.wait()
+        while session and time.perf_counter() < window["end"]:
+            route = random.choices(routes, route_weights)[0]
+            started = time.perf_counter()
+            try: ok = _do_route(session, route, state)
+            except Exception: ok = False
+            finished = time.perf_counter()
+            if started >= window["measure_from"]:
+                with lock: samples[route].append((finished - started, ok))
+
+    threads = [threading.Thread(target=user_loop, args=(n,), daemon=True) for n in range(users)]
+    for t in threads: t.start()
+    window["measure_from"] = time.perf_counter() + warmup
+    window["end"] = window["measure_from"] + duration
+    start_gate.wait()
+    for t in threads: t.join()
+    return summarize(samples, duration)
+
+def _percentile(sorted_values, pct):
+    if not sorted_values: return 0.0
+    k = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1))  # nearest rank
+    return sorted_values[k]
+
+def summarize(samples, duration):
+    report = {}
+    all_latencies, all_errors = [], 0
+    for route, rows in samples.items():
+        latencies = sorted(l for l, _ in rows)
+        errors = sum(1 for _, ok in rows if not ok)
+        all_latencies.extend(latencies); all_errors += errors
+        report[route] = _row(latencies, errors, duration)
+    report["TOTAL"] = _row(sorted(all_latencies), all_errors, duration)
+    return report
+
+def _row(latencies, errors, duration):
+    n = len(latencies)
+    return {
+        "requests": n,
+        "rps": round(n / duration, 1) if duration else 0,
+        "error_rate": round(errors / n, 4) if n else 0.0,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+        "p90_ms": round(_percentile(latencies, 90) * 1000, 1),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+        "max_ms": round((latencies[-1] if latencies else 0) * 1000, 1),
+    }
+
+def print_report(scenario, report, out=sys.stdout):
+    out.write(f"\n== {scenario} ==\n")
+    out.write(f"{'route':<30} {'reqs':>6} {'rps':>7} {'err%':>6} {'p50':>8} {'p90':>8} {'p95':>8} {'p99':>8} {'max':>8}\n")
+    for route, r in report.items():
+        out.write(f"{route:<30} {r['requests']:>6} {r['rps']:>7} {r['error_rate'] * 100:>5.1f}% "
+                  f"{r['p50_ms']:>8} {r['p90_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['max_ms']:>8}\n")
+
+# --- GUNICORN ---
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_gunicorn(workers, threads):
+    port = _free_port()
+    cmd = [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", "--workers", str(workers),
+           "--threads", str(threads), "--log-level", "warning", "loadtest:build_app()"]
+    proc = subprocess.Popen(cmd, cwd=os.path.dirname(os.path.abspath(__file__)), env=os.environ.copy())
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {proc.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return proc, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not start within 30s")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", default="mixed", choices=list(SCENARIOS) + ["all"])
+    parser.add_argument("--users", type=int, default=10, help="concurrent logged-in users")
+    parser.add_argument("--duration", type=float, default=15, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=2, help="unmeasured seconds before each scenario")
+    parser.add_argument("--db-latency-ms", type=float, default=20, help="delay added to every storage call")
+    parser.add_argument("--upstream-latency-ms", type=float, default=50, help="mean delay of fake echo/Scamalytics calls")
+    parser.add_argument("--pool-size", type=int, default=POOL_SEED)
+    parser.add_argument("--gunicorn", action="store_true", help="serve through a local gunicorn instead of the test client")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--json", metavar="PATH", help="also write the reports as JSON")
+    parser.add_argument("--max-p95-ms", type=float, help="fail if any route's p95 exceeds this")
+    parser.add_argument("--max-error-rate", type=float, help="fail if any route's error rate exceeds this (0..1)")
+    args = parser.parse_args(argv)
+
+    os.environ["LOADTEST_DB_LATENCY_MS"] = str(args.db_latency_ms)
+    os.environ["LOADTEST_UPSTREAM_LATENCY_MS"] = str(args.upstream_latency_ms)
+    workdir = prepare_environment()
+    seed(args.pool_size)
+
+    server = None
+    if args.gunicorn:
+        server, base_url = start_gunicorn(args.workers, args.threads)
+        make_session = lambda u, p: HttpSession(base_url, u, p)
+        mode = f"gunicorn {args.workers}x{args.threads} at {base_url}"
+    else:
+        flask_app = build_app()
+        make_session = lambda u, p: TestClientSession(flask_app, u, p)
+        mode = "Flask test client"
+
+    print(f"Load test: {mode}, {args.users} users, {args.duration}s per scenario, "
+          f"db +{args.db_latency_ms}ms/call, upstream ~{args.upstream_latency_ms}ms, data in {workdir}")
+    scenarios = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    reports, failed = {}, []
+    try:
+        for scenario in scenarios:
+            report = run_scenario(make_session, scenario, args.users, args.duration, args.warmup)
+            reports[scenario] = report
+            print_report(scenario, report)
+            for route, r in report.items():
+                if route == "TOTAL" or not r["requests"]: continue
+                if args.max_p95_ms is not None and r["p95_ms"] > args.max_p95_ms:
+                    failed.append(f"{scenario}: {route} p95 {r['p95_ms']}ms > {args.max_p95_ms}ms")
+                if args.max_error_rate is not None and r["error_rate"] > args.max_error_rate:
+                    failed.append(f"{scenario}: {route} error rate {r['error_rate']} > {args.max_error_rate}")
+    finally:
+        if server:
+            server.terminate()
+            server.wait(10)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"mode": mode, "users": args.users, "duration": args.duration, "reports": reports}, f, indent=2)
+    if failed:
+        print("\nThresholds exceeded:\n  " + "\n  ".join(failed))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
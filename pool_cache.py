@@ -0,0 +1,132 @@
+"""
+Read-through cache for the admin pool page. Counts and previews are served from
+memory with stale-while-revalidate semantics, adjusted incrementally when proxies
+are added or cleared, and reconciled against the database by a background job.
+"""
+import logging
+import threading
+import time
+
+import db_util
+
+logger = logging.getLogger(__name__)
+
+POOL_FRESH_FOR = 30            # served as-is
+POOL_STALE_FOR = 3600          # served immediately while a refresh runs in the background
+POOL_RECONCILE_INTERVAL = 300  # background recount of the whole pool
+PREVIEW_PROVIDERS = ("pyproxy", "piaproxy")
+
+class StaleWhileRevalidate:
+    """Single cached value with at most one refresh in flight."""
+    def __init__(self, loader, fresh_for=POOL_FRESH_FOR, stale_for=POOL_STALE_FOR):
+        self._loader = loader
+        self._fresh_for = fresh_for
+        self._stale_for = stale_for
+        self._value = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def get(self):
+        age = time.time() - self._loaded_at
+        if self._value is not None and age < self._fresh_for:
+            return self._value
+        if self._value is not None and age < self._stale_for:
+            self.refresh_async()
+            return self._value
+        return self.refresh()
+
+    def refresh(self):
+        try:
+            value = self._loader()
+        except Exception as e:
+            logger.error(f"Pool cache refresh failed: {e}")
+            return self._value
+        with self._lock:
+            self._value, self._loaded_at = value, time.time()
+        return value
+
+    def refresh_async(self):
+        with self._lock:
+            if self._refreshing: return
+            self._refreshing = True
+        def run():
+            try: self.refresh()
+            finally: self._refreshing = False
+        threading.Thread(target=run, name="pool-cache-refresh", daemon=True).start()
+
+    def update(self, fn):
+        """Applies fn(value) -> value in place; skipped until the first load."""
+        with self._lock:
+            if self._value is not None:
+                self._value = fn(self._value)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0
+
+_stats = StaleWhileRevalidate(lambda: db_util.get_pool_stats())
+_previews = {p: StaleWhileRevalidate(lambda p=p: db_util.get_pool_preview(p)) for p in PREVIEW_PROVIDERS}
+_reconciler = None
+
+def get_cached_pool_stats():
+    _ensure_reconciler()
+    return _stats.get()
+
+def get_cached_pool_preview(provider):
+    cache = _previews.get(provider)
+    return cache.get() if cache else db_util.get_pool_preview(provider)
+
+def note_proxies_added(provider, count):
+    """Bumps counts after add_bulk_proxies; duplicates are corrected on the next reconcile."""
+    if not count: return
+    def bump(stats):
+        stats = dict(stats)
+        stats["total"] = stats.get("total", 0) + count
+        if provider in stats: stats[provider] += count
+        return stats
+    _stats.update(bump)
+    if provider in _previews: _previews[provider].invalidate()
+
+def note_proxies_removed(counts):
+    """Subtracts {provider: removed} after targeted deletes (e.g. the recycler)."""
+    if not counts: return
+    def drop(stats):
+        stats = dict(stats)
+        for provider, count in counts.items():
+            stats["total"] = max(0, stats.get("total", 0) - count)
+            if provider in stats: stats[provider] = max(0, stats[provider] - count)
+        return stats
+    _stats.update(drop)
+    for provider in counts:
+        if provider in _previews: _previews[provider].invalidate()
+
+def note_pool_cleared(provider=None):
+    def clear(stats):
+        if not provider or provider == 'all':
+            return {k: 0 for k in stats}
+        stats = dict(stats)
+        removed = stats.get(provider, 0)
+        stats[provider] = 0
+        stats["total"] = max(0, stats.get("total", 0) - removed)
+        return stats
+    if provider and provider != 'all' and provider not in PREVIEW_PROVIDERS:
+        # No per-provider count to subtract from the total; recount instead
+        _stats.invalidate()
+    else:
+        _stats.update(clear)
+    for name, cache in _previews.items():
+        if not provider or provider in ('all', name):
+            cache.update(lambda _: [])
+
+def _reconcile_loop(interval):
+    while True:
+        time.sleep(interval)
+        _stats.refresh()
+        for cache in _previews.values(): cache.refresh()
+
+def _ensure_reconciler(interval=POOL_RECONCILE_INTERVAL):
+    global _reconciler
+    if _reconciler is None or not _reconciler.is_alive():
+        _reconciler = threading.Thread(target=_reconcile_loop, args=(interval,), name="pool-reconciler", daemon=True)
+        _reconciler.start()
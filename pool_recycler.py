@@ -0,0 +1,172 @@
+"""
+Background recycler for proxy_pool. Takes the least recently probed rows in
+batches, probes each line with a single exit-IP request, and deletes lines that
+fail RECYCLER_STRIKES probes in a row. Strike counts live in the pool rows
+(fail_count, last_probe_at) and a lease in settings lets one worker run a pass
+at a time, so throughput doesn't multiply with the number of gunicorn workers.
+
+POOL_RECYCLER=1              run the recycler thread (otherwise passes only run from the admin page)
+RECYCLER_BATCH=200           rows probed per pass
+RECYCLER_CONCURRENCY=20      probes in flight
+RECYCLER_INTERVAL=120        seconds between passes (across all workers)
+RECYCLER_STRIKES=2           failed passes in a row before a line is deleted
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import db_util
+from ip_echo import detect_exit_ip, proxies_for
+from pool_cache import note_proxies_removed
+
+logger = logging.getLogger(__name__)
+
+RECYCLER_ENABLED = os.environ.get("POOL_RECYCLER", "").strip().upper() in ("1", "TRUE", "YES")
+RECYCLER_BATCH = int(os.environ.get("RECYCLER_BATCH", 200))
+RECYCLER_CONCURRENCY = int(os.environ.get("RECYCLER_CONCURRENCY", 20))
+RECYCLER_INTERVAL = int(os.environ.get("RECYCLER_INTERVAL", 120))
+RECYCLER_STRIKES = int(os.environ.get("RECYCLER_STRIKES", 2))
+PROBE_TIMEOUT = 4
+LEASE_NAME = "POOL_RECYCLER"
+STATS_KEY = "RECYCLER_STATS"
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_lock = threading.Lock()       # one pass at a time within this process
+_thread = None
+
+def probe_alive(proxy_line):
+    """
+    (alive, endpoint). endpoint is the echo URL a failed probe is pinned on when
+    that was the only endpoint it errored on; a proxy that failed on several
+    endpoints, or was refused outright, is blamed itself (endpoint None).
+    """
+    failed = []
+    try:
+        alive = detect_exit_ip(proxies_for(proxy_line), timeout=PROBE_TIMEOUT, race=1, failed_endpoints=failed) is not None
+    except Exception:
+        return False, None
+    return alive, (failed[0] if not alive and len(set(failed)) == 1 else None)
+
+def probe_control():
+    """Echo endpoints reachable without a proxy? If not, failed probes say nothing about the proxies."""
+    try:
+        return detect_exit_ip({}, timeout=PROBE_TIMEOUT) is not None
+    except Exception:
+        return False
+
+def _load_stats():
+    try:
+        stats = json.loads(db_util.get_settings().get(STATS_KEY) or "{}")
+    except (TypeError, ValueError):
+        stats = {}
+    stats.setdefault("passes", 0); stats.setdefault("probed", 0); stats.setdefault("alive", 0)
+    stats.setdefault("evicted", 0); stats.setdefault("evicted_by_provider", {}); stats.setdefault("last_pass", None)
+    return stats
+
+def run_pass(batch_size=None, concurrency=None, lease_ttl=None, probe=probe_alive, control=probe_control):
+    """
+    Probes the next batch of pool rows and evicts the ones that are out of strikes.
+    Returns a summary dict, or None if another pass holds the lease (here or in
+    another worker). lease_ttl defaults to RECYCLER_INTERVAL, which spaces passes
+    out across every worker. probe(line) returns (alive, endpoint) like
+    probe_alive; when most of the batch failed on one endpoint, that endpoint is
+    taken to be down and those rows are left unstruck for the next pass.
+    """
+    if not _lock.acquire(blocking=False): return None
+    try:
+        if not db_util.acquire_lease(LEASE_NAME, WORKER_ID, lease_ttl or RECYCLER_INTERVAL): return None
+        started = time.time()
+        summary = {"probed": 0, "alive": 0, "dead": 0, "struck": 0, "skipped": 0, "evicted": {}, "worker": WORKER_ID}
+        if not control():
+            logger.warning("Pool recycler: echo endpoints unreachable without a proxy; skipping pass")
+            summary["outage"] = True
+            return _finish_pass(summary, started)
+
+        rows = db_util.get_pool_batch(batch_size or RECYCLER_BATCH)
+        if rows:
+            with ThreadPoolExecutor(max_workers=max(1, concurrency or RECYCLER_CONCURRENCY),
+                                    thread_name_prefix="pool-recycler") as pool:
+                results = list(pool.map(lambda r: probe(r["proxy"]), rows))
+        else:
+            results = []
+        alive = [ok for ok, _ in results]
+
+        # Most of the batch failing on the same echo endpoint means that endpoint is down, not the proxies
+        blamed = Counter(endpoint for ok, endpoint in results if not ok and endpoint)
+        outage, outage_count = blamed.most_common(1)[0] if blamed else (None, 0)
+        if outage_count * 2 <= len(rows): outage = None
+        else:
+            logger.warning(f"Pool recycler: {outage_count}/{len(rows)} probes failed on {outage}; not striking them")
+            summary["endpoint_outage"] = outage
+
+        # Batched writes: one update for the live rows, one per new strike count, one delete
+        struck, evict = {}, []
+        for r, (ok, endpoint) in zip(rows, results):
+            if ok: continue
+            if outage and endpoint == outage:
+                summary["skipped"] += 1     # left as is, so the row stays first in line for the next pass
+                continue
+            fails = int(r.get("fail_count") or 0) + 1
+            if fails >= RECYCLER_STRIKES: evict.append(r)
+            else: struck.setdefault(fails, []).append(r["id"])
+        db_util.mark_pool_probed([r["id"] for r, ok in zip(rows, alive) if ok], 0)
+        for fails, ids in struck.items():
+            db_util.mark_pool_probed(ids, fails)
+        if evict and db_util.delete_pool_proxies([r["id"] for r in evict]):
+            for r in evict:
+                provider = r.get("provider") or "manual"
+                summary["evicted"][provider] = summary["evicted"].get(provider, 0) + 1
+            note_proxies_removed(summary["evicted"])
+
+        summary.update(probed=len(rows), alive=sum(alive), dead=len(rows) - sum(alive),
+                       struck=sum(len(ids) for ids in struck.values()))
+        return _finish_pass(summary, started)
+    finally:
+        _lock.release()
+
+def _finish_pass(summary, started):
+    summary["duration"] = round(time.time() - started, 2)
+    summary["finished_at"] = time.time()
+    stats = _load_stats()
+    stats["passes"] += 1
+    stats["probed"] += summary["probed"]
+    stats["alive"] += summary["alive"]
+    for provider, count in summary["evicted"].items():
+        stats["evicted"] += count
+        stats["evicted_by_provider"][provider] = stats["evicted_by_provider"].get(provider, 0) + count
+    stats["last_pass"] = summary
+    db_util.update_setting(STATS_KEY, json.dumps(stats))
+    if summary["evicted"]:
+        logger.info(f"Pool recycler evicted {sum(summary['evicted'].values())} dead proxies: {summary['evicted']}")
+    return summary
+
+def get_recycler_status():
+    """Totals across all workers (persisted in settings) plus this process's configuration."""
+    return {
+        **_load_stats(),
+        "enabled": RECYCLER_ENABLED,
+        "running": _thread is not None and _thread.is_alive(),
+        "batch": RECYCLER_BATCH,
+        "concurrency": RECYCLER_CONCURRENCY,
+        "interval": RECYCLER_INTERVAL,
+        "strikes": RECYCLER_STRIKES,
+    }
+
+def _recycle_loop(interval):
+    while True:
+        try: run_pass()
+        except Exception as e: logger.error(f"Pool recycler pass failed: {e}")
+        time.sleep(interval)
+
+def ensure_recycler(interval=RECYCLER_INTERVAL):
+    """Starts the background thread once, if POOL_RECYCLER is set; passes still go through the shared lease."""
+    global _thread
+    if not RECYCLER_ENABLED: return
+    if _thread is None or not _thread.is_alive():
+        _thread = threading.Thread(target=_recycle_loop, args=(interval,), name="pool-recycler", daemon=True)
+        _thread.start()
@@ -0,0 +1,163 @@
+import hashlib
+import os
+import logging
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+# Local table (one row per host:port:user digest); /tmp survives warm serverless invocations.
+HEALTH_DB_PATH = os.environ.get("PROXY_HEALTH_DB", "/tmp/proxy_health.db")
+
+HISTORY_BITS = 16          # last N outcomes kept as a bitmask (1 = success)
+LATENCY_ALPHA = 0.3        # EWMA weight of the newest latency sample
+DEAD_STREAK = 3            # consecutive unstable/unreachable checks before a proxy counts as dead
+DEAD_TTL = 6 * 3600        # ...for this long after its last failure
+
+# Outcome per check status. "unstable_ip" covers both unreachable and rotating IPs.
+# Statuses not listed ("error" = lookup failed after a good probe, "cancelled") are not recorded.
+OUTCOME_OK = "ok"
+OUTCOME_DIRTY = "dirty"
+OUTCOME_UNSTABLE = "unstable"
+STATUS_OUTCOMES = {
+    "success": OUTCOME_OK,
+    "bad_score": OUTCOME_DIRTY,
+    "bad_cache": OUTCOME_DIRTY,
+    "used_cache": OUTCOME_DIRTY,
+    "unstable_ip": OUTCOME_UNSTABLE,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS proxy_health (
+    key TEXT PRIMARY KEY,
+    checks INTEGER NOT NULL DEFAULT 0,
+    history INTEGER NOT NULL DEFAULT 0,
+    unstable INTEGER NOT NULL DEFAULT 0,
+    fail_streak INTEGER NOT NULL DEFAULT 0,
+    latency REAL,
+    last_status TEXT,
+    updated_at REAL
+) WITHOUT ROWID
+"""
+
+_initialized = False
+
+def _connect():
+    global _initialized
+    conn = sqlite3.connect(HEALTH_DB_PATH, timeout=5)
+    if not _initialized:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(_SCHEMA)
+        _initialized = True
+    return conn
+
+def proxy_key(proxy_line):
+    """
+    host:port:<user digest> of a proxy line. Gateway providers (ABC, pyproxy,
+    piaproxy) share host:port and pick the session through the username, so it
+    has to be part of the key; it is hashed and the password is never stored.
+    """
+    parts = proxy_line.strip().split(":")
+    if len(parts) < 2: return None
+    if len(parts) < 3 or not parts[2]: return f"{parts[0]}:{parts[1]}"
+    return f"{parts[0]}:{parts[1]}:{hashlib.sha256(parts[2].encode()).hexdigest()[:16]}"
+
+def record_results(results):
+    """
+    Records a batch of (proxy_line, status, latency) check outcomes in one transaction.
+    Returns the number of rows written.
+    """
+    now = time.time()
+    rows = []
+    for proxy_line, status, latency in results:
+        outcome = STATUS_OUTCOMES.get(status)
+        key = proxy_key(proxy_line) if proxy_line else None
+        if outcome and key:
+            rows.append((key, outcome, latency, status))
+    if not rows: return 0
+
+    mask = (1 << HISTORY_BITS) - 1
+    try:
+        conn = _connect()
+        with conn:
+            for key, outcome, latency, status in rows:
+                ok = 1 if outcome == OUTCOME_OK else 0
+                failed = 1 if outcome == OUTCOME_UNSTABLE else 0
+                conn.execute(
+                    """
+                    INSERT INTO proxy_health (key, checks, history, unstable, fail_streak, latency, last_status, updated_at)
+                    VALUES (?, 1, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        checks = checks + 1,
+                        history = ((history << 1) | excluded.history) & ?,
+                        unstable = unstable + excluded.unstable,
+                        fail_streak = CASE WHEN excluded.fail_streak = 1 THEN fail_streak + 1 ELSE 0 END,
+                        latency = CASE WHEN excluded.latency IS NULL THEN latency
+                                       WHEN latency IS NULL THEN excluded.latency
+                                       ELSE latency * ? + excluded.latency * ? END,
+                        last_status = excluded.last_status,
+                        updated_at = excluded.updated_at
+                    """,
+                    (key, ok, failed, failed,
+                     latency if not failed else None, status, now,
+                     mask, 1 - LATENCY_ALPHA, LATENCY_ALPHA)
+                )
+        conn.close()
+        return len(rows)
+    except Exception as e:
+        logger.error(f"Error recording proxy health: {e}")
+        return 0
+
+def get_health(keys):
+    """Returns {host:port: row dict} for the given keys that have history."""
+    keys = list({k for k in keys if k})
+    if not keys: return {}
+    out = {}
+    try:
+        conn = _connect()
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            cur = conn.execute(
+                f"SELECT key, checks, history, unstable, fail_streak, latency, last_status, updated_at "
+                f"FROM proxy_health WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+            for r in cur:
+                out[r[0]] = {"checks": r[1], "history": r[2], "unstable": r[3], "fail_streak": r[4],
+                             "latency": r[5], "last_status": r[6], "updated_at": r[7]}
+        conn.close()
+    except Exception as e:
+        logger.error(f"Error reading proxy health: {e}")
+    return out
+
+def is_dead(row, now=None):
+    if not row or row["fail_streak"] < DEAD_STREAK: return False
+    return ((now or time.time()) - (row["updated_at"] or 0)) < DEAD_TTL
+
+def health_score(row):
+    """
+    0..1 priority for a proxy; higher is tried first. Unknown proxies sit at 0.5 so
+    proven ones go ahead of them and proven-bad ones behind.
+    """
+    if not row: return 0.5
+    n = min(row["checks"], HISTORY_BITS)
+    successes = bin(row["history"] & ((1 << n) - 1)).count("1")
+    score = (successes + 1) / (n + 2)  # Laplace-smoothed recent success rate
+    score -= 0.25 * min(row["unstable"] / max(row["checks"], 1), 1)
+    if row["latency"]:
+        score -= 0.1 * min(row["latency"] / 10.0, 1)
+    return max(0.0, min(1.0, score))
+
+def prioritize_proxies(proxies, skip_dead=False):
+    """
+    Orders proxy lines by health score (stable sort, so paste order breaks ties).
+    Known-dead proxies go last, or are dropped with skip_dead.
+    Returns (ordered_proxies, dead_count).
+    """
+    health = get_health(proxy_key(p) for p in proxies)
+    if not health: return list(proxies), 0
+    now = time.time()
+    alive, dead = [], []
+    for p in proxies:
+        row = health.get(proxy_key(p))
+        (dead if is_dead(row, now) else alive).append(p)
+    alive.sort(key=lambda p: health_score(health.get(proxy_key(p))), reverse=True)
+    return (alive if skip_dead else alive + dead), len(dead)
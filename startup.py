@@ -0,0 +1,123 @@
+"""
+Cold-start helpers: import-time profiling, lazy module loading and an optional
+on-disk warm snapshot of settings and IP indexes.
+
+STARTUP_PROFILE=1       time every module imported while the app loads
+WARM_SNAPSHOT_PATH=...  e.g. /tmp/proxy_checker_warm.json; unset disables the snapshot
+"""
+import builtins
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+STARTUP_PROFILE = os.environ.get("STARTUP_PROFILE", "").strip().upper() in ("1", "TRUE", "YES")
+WARM_SNAPSHOT_PATH = os.environ.get("WARM_SNAPSHOT_PATH", "").strip()
+WARM_SNAPSHOT_MAX_AGE = int(os.environ.get("WARM_SNAPSHOT_MAX_AGE", 300))
+
+PROCESS_STARTED = time.time()
+
+# --- IMPORT PROFILE ---
+_import_stats = {}    # module -> [inclusive seconds, self seconds]
+_import_stack = []
+_original_import = None
+_profile_window = {}
+
+def _profiling_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    _import_stack.append(0.0)
+    started = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - started
+        children = _import_stack.pop()
+        if _import_stack: _import_stack[-1] += elapsed
+        _import_stats.setdefault(name, [elapsed, elapsed - children])
+
+def start_import_profile():
+    """Wraps __import__ so each first-time import is timed (inclusive and self time)."""
+    global _original_import
+    if _original_import is not None: return
+    _original_import = builtins.__import__
+    builtins.__import__ = _profiling_import
+    _profile_window["started"] = time.perf_counter()
+
+def finish_import_profile(top=20):
+    """Restores __import__ and logs the most expensive imports. Returns the report."""
+    global _original_import
+    if _original_import is None: return get_import_profile(top)
+    builtins.__import__ = _original_import
+    _original_import = None
+    _profile_window["total"] = time.perf_counter() - _profile_window.get("started", time.perf_counter())
+    report = get_import_profile(top)
+    logger.info(f"Startup import profile: {report['total_ms']}ms total")
+    for row in report["modules"]:
+        logger.info(f"  {row['module']:<40} {row['inclusive_ms']:>9.1f}ms  (self {row['self_ms']:.1f}ms)")
+    return report
+
+def get_import_profile(top=20):
+    rows = sorted(_import_stats.items(), key=lambda kv: kv[1][0], reverse=True)[:top]
+    return {
+        "enabled": STARTUP_PROFILE,
+        "total_ms": round(_profile_window.get("total", 0) * 1000, 1),
+        "process_age_s": round(time.time() - PROCESS_STARTED, 1),
+        "modules": [{"module": name, "inclusive_ms": round(inc * 1000, 1), "self_ms": round(own * 1000, 1)}
+                    for name, (inc, own) in rows],
+    }
+
+# --- LAZY MODULES ---
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access."""
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__["_module"] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+# --- WARM SNAPSHOT ---
+def load_warm_snapshot(key):
+    """
+    Returns (data, saved_at) for key if the snapshot is enabled and fresh, else
+    (None, None). Callers should age their cache from saved_at, not from the load.
+    """
+    if not WARM_SNAPSHOT_PATH: return None, None
+    try:
+        with open(WARM_SNAPSHOT_PATH) as f:
+            entry = json.load(f).get(key)
+    except (OSError, ValueError):
+        return None, None
+    if not entry or time.time() - entry.get("saved_at", 0) > WARM_SNAPSHOT_MAX_AGE:
+        return None, None
+    return entry.get("data"), entry.get("saved_at")
+
+def save_warm_snapshot(key, data):
+    """Stores one entry in the snapshot file (atomic replace, owner-only permissions)."""
+    if not WARM_SNAPSHOT_PATH: return False
+    try:
+        try:
+            with open(WARM_SNAPSHOT_PATH) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            snapshot = {}
+        snapshot[key] = {"saved_at": time.time(), "data": data}
+        tmp = f"{WARM_SNAPSHOT_PATH}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, WARM_SNAPSHOT_PATH)
+        return True
+    except Exception as e:
+        logger.warning(f"Could not write warm snapshot: {e}")
+        return False
@@ -0,0 +1,105 @@
+"""
+Exit-IP detection against the local echo server (ip_echo.serve) behind a stub
+HTTP proxy, covering which failures are blamed on the proxy and which on the
+echo endpoint.
+
+    python -m pytest -q test_ip_echo.py
+"""
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import ip_echo
+
+class _StubProxy(BaseHTTPRequestHandler):
+    """Forwards plain-HTTP GETs; answers every CONNECT (HTTPS tunnel) with server.tunnel_status."""
+    def do_CONNECT(self):
+        self.send_response(self.server.tunnel_status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        if self.server.require_auth:
+            self.send_response(407)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        upstream = requests.get(self.path, timeout=2)
+        self.send_response(upstream.status_code)
+        self.send_header("Content-Type", upstream.headers.get("Content-Type", "text/plain"))
+        self.send_header("Content-Length", str(len(upstream.content)))
+        self.end_headers()
+        self.wfile.write(upstream.content)
+
+    def log_message(self, format, *args):
+        pass
+
+def _start_proxy(tunnel_status=502, require_auth=False):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubProxy)
+    server.daemon_threads = True
+    server.tunnel_status, server.require_auth = tunnel_status, require_auth
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _proxies(port):
+    url = f"http://user:pw@127.0.0.1:{port}"
+    return {"http": url, "https": url}
+
+def _errors(url):
+    return next(s["errors"] for s in ip_echo.get_endpoint_stats() if s["url"] == url)
+
+@pytest.fixture
+def echo_url(monkeypatch):
+    monkeypatch.setattr(ip_echo, "EXPLORE_RATE", 0)   # keep the racing order deterministic
+    ip_echo.reset_endpoint_stats()
+    server = ip_echo.serve()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+
+@pytest.fixture
+def proxy():
+    server = _start_proxy()
+    yield server
+    server.shutdown()
+
+def test_exit_ip_through_proxy(echo_url, proxy):
+    assert ip_echo.detect_exit_ip(_proxies(proxy.server_port), timeout=3, endpoints=[echo_url]) == "127.0.0.1"
+    assert _errors(echo_url) == 0
+
+@pytest.mark.parametrize("race", [1, 2])
+def test_tunnel_5xx_is_an_endpoint_error_and_fails_over(echo_url, proxy, race):
+    # The proxy is up but can't reach this endpoint: 502 on CONNECT
+    unreachable = f"https://127.0.0.1:{proxy.server_port}/unreachable-{race}"
+    ip = ip_echo.detect_exit_ip(_proxies(proxy.server_port), timeout=3, endpoints=[unreachable, echo_url], race=race)
+    assert ip == "127.0.0.1"
+    assert _errors(unreachable) == 1
+    assert ip_echo.ranked_endpoints([unreachable, echo_url])[0] == echo_url
+
+def test_refused_proxy_is_not_blamed_on_endpoints(echo_url):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        closed_port = s.getsockname()[1]
+    https_url = f"https://127.0.0.1:{closed_port}/tls"
+    assert ip_echo.detect_exit_ip(_proxies(closed_port), timeout=3, endpoints=[echo_url, https_url]) is None
+    assert _errors(echo_url) == 0 and _errors(https_url) == 0
+
+@pytest.mark.parametrize("scheme", ["http", "https"])
+def test_proxy_auth_rejected_is_not_blamed_on_endpoints(echo_url, scheme):
+    server = _start_proxy(tunnel_status=407, require_auth=True)
+    url = echo_url if scheme == "http" else f"https://127.0.0.1:{server.server_port}/tls"
+    try:
+        assert ip_echo.detect_exit_ip(_proxies(server.server_port), timeout=3, endpoints=[url]) is None
+    finally:
+        server.shutdown()
+    assert _errors(url) == 0
+
+def test_time_queued_for_a_thread_does_not_count(echo_url, proxy, monkeypatch):
+    # One probe thread, held busy for longer than the caller's timeout
+    monkeypatch.setattr(ip_echo, "_executor", ip_echo.ThreadPoolExecutor(max_workers=1))
+    release = threading.Event()
+    ip_echo._executor.submit(release.wait)
+    threading.Timer(1.5, release.set).start()
+    assert ip_echo.detect_exit_ip(_proxies(proxy.server_port), timeout=1, endpoints=[echo_url]) == "127.0.0.1"
@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+from flask_login import UserMixin
+from werkzeug.security import check_password_hash
+
+from db_util import get_app_users
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_DURATION = 300
+USER_RETRY_AFTER = 30       # reload sooner after a failed load
+
+class User(UserMixin):
+    def __init__(self, id, username, password_hash, role="user", can_fetch=False):
+        self.id = id
+        self.username = username
+        self.password_hash = password_hash
+        self.role = role
+        self.can_fetch = can_fetch
+
+    @property
+    def is_admin(self):
+        return self.role == "admin"
+
+    @property
+    def is_guest(self):
+        return self.role == "guest"
+
+# Built-in accounts, used when the app_users table is empty or unreachable.
+# Generate new hashes with werkzeug.security.generate_password_hash(pw, method="pbkdf2:sha256:260000").
+DEFAULT_USERS = [
+    {"id": 1, "username": "EL", "role": "admin", "can_fetch": True,
+     "password_hash": "pbkdf2:sha256:260000$I2yWFxzNu2YejRpo$3a81d4370488683fe0c873b353246951263090d25bfffd1147f9228f7a0007ce"},
+    {"id": 2, "username": "Work2", "role": "user", "can_fetch": True,
+     "password_hash": "pbkdf2:sha256:260000$a65M3qVY3Me5L4pA$8ace920355da18f88287af60f716651907df5ee22a0b658ec81833bcc6a51203"},
+]
+
+# Checked against when the username is unknown, so a miss costs the same as a wrong password
+_DUMMY_HASH = "pbkdf2:sha256:260000$nTBfxwErZB2COJJE$c2434fc9a3dbc345c7de7d6afc14ffa51c69816523607289ab540f6accba3835"
+
+class UserStore:
+    """
+    Cached user registry indexed by id and username.
+    Rows come from the app_users table, falling back to DEFAULT_USERS when the
+    table is empty or the very first load fails, and are reloaded at most every
+    USER_CACHE_DURATION seconds. A failed reload keeps the previous index.
+    """
+    def __init__(self, loader=get_app_users, defaults=DEFAULT_USERS, ttl=USER_CACHE_DURATION):
+        self._loader = loader
+        self._defaults = defaults
+        self._ttl = ttl
+        self._by_id = {}
+        self._by_username = {}
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def _build(self, rows):
+        by_id, by_username = {}, {}
+        for r in rows:
+            try:
+                user = User(int(r["id"]), r["username"], r["password_hash"],
+                            role=r.get("role") or "user", can_fetch=bool(r.get("can_fetch")))
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Skipping malformed user row: {e}")
+                continue
+            by_id[user.id] = user
+            by_username[user.username] = user
+        return by_id, by_username
+
+    def refresh(self, force=False):
+        if not force and self._by_id and time.time() - self._loaded_at < self._ttl:
+            return
+        with self._lock:
+            if not force and self._by_id and time.time() - self._loaded_at < self._ttl:
+                return
+            try:
+                rows = self._loader() or []
+            except Exception as e:
+                if self._by_id:
+                    # Keep serving the last good index; retry after USER_RETRY_AFTER rather than the full TTL
+                    logger.error(f"User load failed, keeping {len(self._by_id)} cached users: {e}")
+                    self._loaded_at = time.time() - self._ttl + USER_RETRY_AFTER
+                    return
+                logger.error(f"User load failed, using default users: {e}")
+                self._by_id, self._by_username = self._build(self._defaults)
+                self._loaded_at = time.time() - self._ttl + USER_RETRY_AFTER
+                return
+            by_id, by_username = self._build(rows)
+            if not by_id:
+                by_id, by_username = self._build(self._defaults)
+            self._by_id, self._by_username = by_id, by_username
+            self._loaded_at = time.time()
+
+    def get(self, user_id):
+        self.refresh()
+        try:
+            return self._by_id.get(int(user_id))
+        except (TypeError, ValueError):
+            return None
+
+    def get_by_username(self, username):
+        self.refresh()
+        return self._by_username.get(username)
+
+    def authenticate(self, username, password):
+        """Returns the user if the password matches; always pays exactly one hash check."""
+        user = self.get_by_username(username) if username else None
+        ok = check_password_hash(user.password_hash if user else _DUMMY_HASH, password or "")
+        return user if user and ok else None